@@ -0,0 +1,152 @@
+# app/analytics.py
+# Funil de oportunidades (GET /opportunities/funnel) calculado sobre
+# opportunity_stage_history numa única consulta com funções de janela:
+# - LEAD() dá o fim de cada passagem por um estágio (tempo no estágio)
+# - MAX() sobre as transições seguintes diz se a oportunidade avançou no funil depois
+# - ROW_NUMBER()/COUNT() por estágio dão as medianas sem percentile_cont (inexistente no SQLite)
+# - o histórico é lido pelo índice (opportunity_id, changed_at, id), já na ordem das janelas
+# O Python só monta a resposta a partir de uma linha por estágio.
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import DateTime, bindparam, text
+from sqlalchemy.orm import Session
+
+import models
+
+# Ordem do funil; lost é saída, não etapa
+FUNNEL = (
+    models.OpportunityStage.new,
+    models.OpportunityStage.qualified,
+    models.OpportunityStage.proposal,
+    models.OpportunityStage.won,
+)
+
+_STAGE_RANK = "CASE {column} " + " ".join(
+    f"WHEN '{stage.value}' THEN {rank}" for rank, stage in enumerate(FUNNEL)
+) + " END"
+
+_SECONDS = {
+    "postgresql": "EXTRACT(EPOCH FROM ({end} - {start}))",
+    "sqlite": "(julianday({end}) - julianday({start})) * 86400.0",
+}
+
+FUNNEL_SQL = """
+WITH transitions AS (
+    SELECT h.opportunity_id, h.to_stage, h.changed_at,
+           {rank} AS stage_rank,
+           LEAD(h.changed_at) OVER w AS left_at,
+           MAX({rank}) OVER (w ROWS BETWEEN 1 FOLLOWING AND UNBOUNDED FOLLOWING) AS later_rank,
+           MAX(CASE WHEN h.to_stage = 'lost' THEN 1 ELSE 0 END)
+               OVER (w ROWS BETWEEN 1 FOLLOWING AND UNBOUNDED FOLLOWING) AS later_lost,
+           FIRST_VALUE(h.changed_at) OVER w AS first_at
+    FROM opportunity_stage_history h
+    WHERE h.opportunity_id IN (
+        SELECT opportunity_id FROM opportunity_stage_history
+        WHERE changed_at >= :date_from AND changed_at < :date_to
+    )
+    WINDOW w AS (PARTITION BY h.opportunity_id ORDER BY h.changed_at, h.id)
+),
+entries AS (
+    SELECT t.to_stage, o.value,
+           CASE WHEN t.later_rank > t.stage_rank THEN 1 ELSE 0 END AS advanced,
+           COALESCE(t.later_lost, 0) AS lost,
+           {stay_seconds} AS stay_seconds,
+           {age_seconds} AS age_seconds
+    FROM transitions t LEFT JOIN opportunities o ON o.id = t.opportunity_id
+    WHERE t.changed_at >= :date_from AND t.changed_at < :date_to
+),
+{stay_median},
+{age_median}
+SELECT e.to_stage,
+       COUNT(*) AS entered,
+       SUM(e.advanced) AS advanced,
+       SUM(e.lost) AS lost,
+       SUM(COALESCE(e.value, 0)) AS value,
+       MAX(sm.median) AS median_stay,
+       MAX(am.median) AS median_age
+FROM entries e
+LEFT JOIN stay_median sm ON sm.to_stage = e.to_stage
+LEFT JOIN age_median am ON am.to_stage = e.to_stage
+GROUP BY e.to_stage
+"""
+
+
+# Mediana por estágio ordenando só (to_stage, segundos), não a linha inteira de entries
+MEDIAN_SQL = """
+{column}_ranked AS (
+    SELECT to_stage, {column},
+           ROW_NUMBER() OVER (PARTITION BY to_stage ORDER BY {column}) AS rn,
+           COUNT(*) OVER (PARTITION BY to_stage) AS n
+    FROM entries WHERE {column} IS NOT NULL
+),
+{name} AS (
+    SELECT to_stage, AVG({column}) AS median
+    FROM {column}_ranked WHERE rn IN ((n + 1) / 2, (n + 2) / 2)
+    GROUP BY to_stage
+)"""
+
+
+def _funnel_sql(dialect: str) -> str:
+    seconds = _SECONDS.get(dialect, _SECONDS["postgresql"])
+    return FUNNEL_SQL.format(
+        rank=_STAGE_RANK.format(column="h.to_stage"),
+        stay_seconds=seconds.format(start="t.changed_at", end="t.left_at"),
+        age_seconds=seconds.format(start="t.first_at", end="t.changed_at"),
+        stay_median=MEDIAN_SQL.format(column="stay_seconds", name="stay_median").strip(),
+        age_median=MEDIAN_SQL.format(column="age_seconds", name="age_median").strip(),
+    )
+
+
+def funnel(db: Session, date_from: datetime, date_to: datetime) -> dict:
+    """Entradas em cada estágio dentro de [date_from, date_to) e o que aconteceu depois.
+
+    conversion_rate: fração das entradas que avançaram para uma etapa seguinte do funil
+    (a qualquer tempo); median_seconds_in_stage: só passagens já encerradas;
+    median_seconds_to_reach: desde a criação da oportunidade.
+    """
+    date_from, date_to = _utc(date_from), _utc(date_to)
+    if date_from >= date_to:
+        raise ValueError("from deve ser anterior a to")
+    stmt = text(_funnel_sql(db.get_bind().dialect.name)).bindparams(
+        bindparam("date_from", date_from, type_=DateTime(timezone=True)),
+        bindparam("date_to", date_to, type_=DateTime(timezone=True)),
+    )
+    rows = {models.OpportunityStage(row.to_stage): row for row in db.execute(stmt)}
+
+    stages = []
+    for stage in models.OpportunityStage:
+        row = rows.get(stage)
+        entered = row.entered if row else 0
+        advanced = row.advanced if row else 0
+        in_funnel = stage in FUNNEL[:-1]
+        stages.append({
+            "stage": stage,
+            "entered": entered,
+            "advanced": advanced if in_funnel else None,
+            "lost": row.lost if row else 0,
+            "conversion_rate": advanced / entered if in_funnel and entered else None,
+            "value": float(row.value) if row else 0.0,
+            "median_seconds_in_stage": _float(row.median_stay) if row else None,
+            "median_seconds_to_reach": _float(row.median_age) if row else None,
+        })
+
+    won = rows.get(models.OpportunityStage.won)
+    days = (date_to - date_from).total_seconds() / 86400
+    velocity = {
+        "won": won.entered if won else 0,
+        "won_value": float(won.value) if won else 0.0,
+        "won_per_day": (won.entered if won else 0) / days,
+        "won_value_per_day": (float(won.value) if won else 0.0) / days,
+        "median_days_to_win": _float(won.median_age) / 86400 if won and won.median_age is not None else None,
+    }
+    return {"date_from": date_from, "date_to": date_to, "stages": stages, "velocity": velocity}
+
+
+def _utc(value: datetime) -> datetime:
+    # datas sem fuso são tratadas como UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _float(value) -> Optional[float]:
+    return None if value is None else float(value)
@@ -1,25 +1,35 @@
 # app/auth.py
-from datetime import datetime, timedelta
+import os
+import secrets
+from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
+from fastapi.security import APIKeyHeader, OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from typing import Optional
 from database import Base,SessionLocal,engine,get_db
 # CORREÇÃO: Mudar importações relativas para absolutas
+import cache
+import crud
+import hashing
 import models
+import revocation
 
 # Configurações de JWT
 SECRET_KEY = "supersecretkey"  # ideal usar variável de ambiente
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60
+# Acesso curto (a revogação só é necessária para logout imediato); a sessão continua
+# com o refresh token em POST /token/refresh
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
 
-# Contexto de hash de senha
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Contexto de hash de senha (o mesmo usado pelo pool de hashing.py)
+pwd_context = hashing.pwd_context
 
 # OAuth2
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token", auto_error=False)
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
 # ----- Utilitários de senha -----
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -29,28 +39,92 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 # ----- Criação de token -----
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+# Todo token tem "type" (access ou refresh) e um "jti" único, usado na revogação
+def _create_token(data: dict, token_type: str, expires_delta: timedelta) -> str:
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    expire = datetime.now(timezone.utc) + expires_delta
+    to_encode.update({"exp": expire, "type": token_type, "jti": secrets.token_urlsafe(16)})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+    return _create_token(data, "access", expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
+def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+    return _create_token(data, "refresh", expires_delta or timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+
+def create_token_pair(user_id: int) -> dict:
+    data = {"sub": str(user_id)}
+    return {
+        "access_token": create_access_token(data),
+        "refresh_token": create_refresh_token(data),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+def decode_token(token: str, *token_types: str) -> dict:
+    """Payload de um token válido de um dos tipos pedidos (sem checar revogação), ou 401."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload["sub"] = int(payload.get("sub"))
+    except (JWTError, TypeError, ValueError):
+        raise _credentials_exception()
+    # um refresh token não serve de acesso, nem o contrário; tokens sem jti (emitidos
+    # antes da revogação existir) não são mais aceitos
+    if payload.get("type") not in token_types or not payload.get("jti") or not payload.get("exp"):
+        raise _credentials_exception()
+    return payload
+
 # ----- Obter usuário atual -----
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> models.User:
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Credenciais inválidas",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
 
-    user = db.get(models.User, user_id)
+def _load_user(db: Session, user_id: int) -> models.User:
+    user = cache.get_user(user_id)
     if user is None:
-        raise credentials_exception
-    return user
\ No newline at end of file
+        read_generation = cache.generation()
+        user = db.get(models.User, user_id)
+        if user is None:
+            raise _credentials_exception()
+        cache.put_user(user, read_generation)
+    return user
+
+def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> models.User:
+    verified = cache.get_token(token)
+    if verified is None:
+        payload = decode_token(token, "access")
+        verified = (payload["sub"], payload["jti"])
+        cache.put_token(token, *verified, payload["exp"])
+    user_id, jti = verified
+    # também com o token no cache: a revogação vale a partir da próxima requisição
+    if revocation.revoked.is_revoked(db, jti):
+        raise _credentials_exception()
+    return _load_user(db, user_id)
+
+# ----- Chaves de API -----
+def get_api_key_user(db: Session, key: str) -> models.User:
+    # sha256 + busca pelo índice (ou cache): microssegundos, sem bcrypt
+    key_hash = hashing.digest(key)
+    user_id = cache.get_api_key(key_hash)
+    if user_id is None:
+        read_generation = cache.generation()
+        user_id = crud.get_api_key_user_id(db, key_hash)
+        if user_id is None:
+            raise _credentials_exception()
+        cache.put_api_key(key_hash, user_id, read_generation)
+    return _load_user(db, user_id)
+
+def get_current_user_or_api_key(
+    db: Session = Depends(get_db),
+    api_key: Optional[str] = Depends(api_key_header),
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+) -> models.User:
+    """Aceita X-API-Key (integrações) ou o Bearer de /token (pessoas)."""
+    if api_key:
+        return get_api_key_user(db, api_key)
+    if token:
+        return get_current_user(db, token)
+    raise _credentials_exception()
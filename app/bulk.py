@@ -0,0 +1,163 @@
+# app/bulk.py
+# Importação em massa de clientes (POST /customers/bulk).
+# O corpo é lido em streaming, validado em lotes contra schemas.CustomerCreate e
+# inserido com uma instrução por lote (COPY no PostgreSQL); a memória usada
+# depende do tamanho do lote, não do arquivo.
+import codecs
+import csv
+import json
+import re
+from typing import AsyncIterator, Iterable, Iterator, Optional, Tuple
+
+from anyio import from_thread
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+import crud
+import schemas
+
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+FORMATS = {
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/json-seq": "ndjson",
+    "text/csv": "csv",
+}
+
+
+def detect_format(content_type: Optional[str]) -> Optional[str]:
+    if not content_type:
+        return None
+    return FORMATS.get(content_type.split(";")[0].strip().lower())
+
+
+# ----- Leitura do corpo -----
+def iter_body(stream: AsyncIterator[bytes]) -> Iterator[bytes]:
+    """Consome request.stream() a partir de uma thread de trabalho do AnyIO."""
+    async def _next():
+        return await stream.__anext__()
+
+    while True:
+        try:
+            yield from_thread.run(_next)
+        except StopAsyncIteration:
+            return
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def iter_records(lines: Iterable[str], fmt: str) -> Iterator[Tuple[int, object]]:
+    """Gera (número da linha de dados, registro); registros inválidos viram exceções."""
+    if fmt == "csv":
+        for row, record in enumerate(csv.DictReader(lines), start=1):
+            # células vazias equivalem a campo ausente
+            yield row, {k: (v if v != "" else None) for k, v in record.items() if k is not None}
+        return
+    row = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            yield row, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row, ValueError(f"JSON inválido: {e.msg}")
+
+
+# ----- Validação -----
+# Parte local "simples" (dot-atom ASCII, sem aspas): a validade do email passa a
+# depender só do domínio, que é o trecho caro da validação (IDNA)
+_SIMPLE_LOCAL = re.compile(r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*")
+_MAX_CACHED_DOMAINS = 10_000
+
+
+class CustomerValidator:
+    """Valida registros contra schemas.CustomerCreate reaproveitando domínios já validados."""
+
+    def __init__(self):
+        self.domains: dict[str, str] = {}
+
+    def __call__(self, record) -> dict:
+        email = record.get("email") if isinstance(record, dict) else None
+        if isinstance(email, str):
+            local, _, domain = email.rpartition("@")
+            normalized_domain = self.domains.get(domain)
+            if normalized_domain and len(local) <= 64 and len(email) <= 254 and _SIMPLE_LOCAL.fullmatch(local):
+                data = schemas.CustomerCreate.model_validate({**record, "email": None}).model_dump()
+                data["email"] = f"{local}@{normalized_domain}"
+                return data
+        data = schemas.CustomerCreate.model_validate(record).model_dump()
+        if data["email"] and len(self.domains) < _MAX_CACHED_DOMAINS:
+            local, _, domain = email.rpartition("@")
+            if _SIMPLE_LOCAL.fullmatch(local):
+                self.domains[domain] = data["email"].rpartition("@")[2]
+        return data
+
+
+# ----- Importação -----
+def _format_errors(error: ValidationError) -> list[str]:
+    return [
+        f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" if e["loc"] else e["msg"]
+        for e in error.errors(include_url=False)
+    ]
+
+
+def import_customers(db: Session, chunks: Iterable[bytes], fmt: str, chunk_size: int = CHUNK_SIZE) -> dict:
+    report = {"received": 0, "inserted": 0, "failed": 0, "errors": [], "errors_truncated": False}
+
+    def fail(row: int, messages: list[str], email: Optional[str] = None):
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"row": row, "email": email, "errors": messages})
+        else:
+            report["errors_truncated"] = True
+
+    validate = CustomerValidator()
+    batch: list[Tuple[int, dict]] = []
+
+    def flush():
+        # cada lote é confirmado separadamente: uma importação longa não segura uma transação só
+        returned = crud.insert_customers(db, [data for _, data in batch])
+        db.commit()
+        inserted = set(e for e in returned if e is not None)
+        seen = set()
+        for row, data in batch:
+            email = data["email"]
+            if email is None:
+                report["inserted"] += 1
+            elif email in inserted and email not in seen:
+                seen.add(email)
+                report["inserted"] += 1
+            else:
+                fail(row, ["Email já cadastrado."], email)
+        batch.clear()
+
+    for row, record in iter_records(iter_lines(chunks), fmt):
+        report["received"] += 1
+        if isinstance(record, Exception):
+            fail(row, [str(record)])
+            continue
+        try:
+            batch.append((row, validate(record)))
+        except ValidationError as e:
+            fail(row, _format_errors(e))
+            continue
+        if len(batch) >= chunk_size:
+            flush()
+    if batch:
+        flush()
+    report["errors"].sort(key=lambda e: e["row"])
+    return report
@@ -0,0 +1,281 @@
+# app/cache.py
+# Caches em memória da autenticação (auth.get_current_user):
+# - users: usuário por id, para não ir ao banco (checkout do pool + ida e volta) a
+#   cada requisição autenticada. Guarda só os valores das colunas; cada hit devolve
+#   um models.User novo, desanexado, então requisições não compartilham objetos.
+# - tokens: token já verificado, pela chave sha256(token) -> (user_id, jti, exp). Um
+#   hit pula a verificação da assinatura; a expiração continua sendo conferida, e a
+#   revogação (revocation.py) é checada pelo jti em toda requisição.
+# - api_keys: sha256 da chave de API -> user_id; um hit dispensa a consulta a api_keys.
+#
+# Todos são LRU com TTL (USER_CACHE_TTL_SECONDS, padrão 30). crud.update_user e
+# crud.delete_user chamam invalidate_user(), e a revogação de uma chave chama
+# invalidate_api_key(); com vários workers, a invalidação é repassada pelo canal
+# escolhido em USER_CACHE_CHANNEL:
+# - local (padrão): só o próprio processo; nos outros workers o TTL limita o atraso
+# - postgres: NOTIFY/LISTEN no canal crm_user_invalidation. Se a conexão de escuta
+#   cair, o cache é esvaziado (mensagens podem ter sido perdidas) e ela é refeita.
+import hashlib
+import logging
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import make_transient_to_detached
+
+import models
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("USER_CACHE", "1").lower() not in ("0", "false", "off")
+TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+MAX_USERS = int(os.getenv("USER_CACHE_MAX_USERS", "10000"))
+MAX_TOKENS = int(os.getenv("USER_CACHE_MAX_TOKENS", "50000"))
+MAX_API_KEYS = int(os.getenv("USER_CACHE_MAX_API_KEYS", "10000"))
+CHANNEL = os.getenv("USER_CACHE_CHANNEL", "local")
+
+MISSING = object()
+
+
+class TTLCache:
+    """LRU com expiração por entrada; seguro entre threads."""
+
+    def __init__(self, maxsize: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return MISSING
+            expires, value = item
+            if expires <= self.clock():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (self.clock() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+users = TTLCache(MAX_USERS, TTL_SECONDS)
+tokens = TTLCache(MAX_TOKENS, TTL_SECONDS)
+api_keys = TTLCache(MAX_API_KEYS, TTL_SECONDS)
+
+
+# ----- Invalidação local -----
+# Muda a cada invalidação: quem leu do banco antes de uma invalidação não coloca essa
+# leitura (talvez antiga) no cache depois dela
+_generation = 0
+
+
+def generation() -> int:
+    return _generation
+
+
+# Outros módulos recebem suas mensagens pelo mesmo canal: handlers[kind](key) para
+# "<kind>:<key>", e handler(None) quando mensagens podem ter sido perdidas
+handlers: dict[str, Callable[[Optional[str]], None]] = {}
+
+
+def _forget(message: Optional[str] = None):
+    """message: "user:<id>", "api_key:<sha256>", "<kind>:<key>" de handlers ou None (tudo)."""
+    global _generation
+    _generation += 1
+    kind, _, key = (message or "").partition(":")
+    if kind == "user":
+        users.pop(int(key))
+    elif kind == "api_key":
+        api_keys.pop(key)
+    elif kind in handlers:
+        handlers[kind](key)
+    else:
+        users.clear()
+        api_keys.clear()
+        for handler in handlers.values():
+            handler(None)
+
+
+def _publish(message: str):
+    _forget(message)
+    if channel is not None:
+        channel.publish(message)
+
+
+def publish(kind: str, key: str):
+    """Entrega "<kind>:<key>" a handlers[kind] neste processo e nos demais."""
+    _publish(f"{kind}:{key}")
+
+
+# ----- Usuários -----
+
+
+def get_user(user_id: int) -> Optional[models.User]:
+    values = users.get(user_id) if ENABLED else MISSING
+    if values is MISSING:
+        return None
+    user = models.User(**values)
+    make_transient_to_detached(user)  # como se viesse do banco: merge() não faz INSERT
+    return user
+
+
+def put_user(user: models.User, read_generation: int):
+    """read_generation: valor de generation() antes da leitura do usuário no banco."""
+    if ENABLED and read_generation == _generation:
+        users.set(user.id, {c.key: getattr(user, c.key) for c in models.User.__table__.columns})
+
+
+def invalidate_user(user_id: int):
+    """Remove o usuário deste processo e avisa os demais pelo canal."""
+    _publish(f"user:{user_id}")
+
+
+# ----- Tokens verificados -----
+def token_key(token: str) -> str:
+    # o token em si não fica na memória do cache (também é o key_hash das chaves de API)
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def get_token(token: str) -> Optional[tuple[int, str]]:
+    """(user_id, jti) de um token já verificado e ainda não expirado, ou None. A
+    revogação não é conferida aqui: quem chama consulta revocation a cada uso."""
+    item = tokens.get(token_key(token)) if ENABLED else MISSING
+    if item is MISSING:
+        return None
+    user_id, jti, exp = item
+    return (user_id, jti) if exp > time.time() else None
+
+
+def put_token(token: str, user_id: int, jti: str, exp: float):
+    if ENABLED:
+        tokens.set(token_key(token), (user_id, jti, exp), ttl=exp - time.time())
+
+
+# ----- Chaves de API (pelo sha256) -----
+def get_api_key(digest: str) -> Optional[int]:
+    user_id = api_keys.get(digest) if ENABLED else MISSING
+    return None if user_id is MISSING else user_id
+
+
+def put_api_key(digest: str, user_id: int, read_generation: int):
+    if ENABLED and read_generation == _generation:
+        api_keys.set(digest, user_id)
+
+
+def invalidate_api_key(digest: str):
+    _publish(f"api_key:{digest}")
+
+
+# ----- Invalidação entre workers -----
+class PostgresChannel:
+    """NOTIFY ao invalidar; uma thread faz LISTEN e invalida localmente o que chegar."""
+
+    name = "crm_user_invalidation"
+
+    def __init__(self, engine: Engine, on_message: Callable[[str], None], on_gap: Callable[[], None]):
+        self.engine = engine
+        self.on_message = on_message
+        self.on_gap = on_gap
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def publish(self, message: str):
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                             {"channel": self.name, "payload": message})
+        except Exception:
+            # os outros workers ficam com o TTL como limite
+            logger.exception("Falha ao publicar invalidação %s", message)
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="user-cache-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.exception("Conexão de LISTEN perdida; refazendo")
+                self._stopping.wait(1)
+            # entre uma conexão e outra podem ter sido perdidas invalidações
+            self.on_gap()
+
+    def _listen(self):
+        raw = self.engine.raw_connection()
+        try:
+            conn = raw.driver_connection
+            conn.rollback()  # autocommit só pode ser ligado fora de transação
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {self.name}")
+            while not self._stopping.is_set():
+                if select.select([conn], [], [], 1.0)[0]:
+                    conn.poll()
+                    while conn.notifies:
+                        self.on_message(conn.notifies.pop(0).payload)
+        finally:
+            raw.invalidate()  # não devolve ao pool uma conexão em autocommit com LISTEN
+
+
+# Outros canais (ex.: Redis pub/sub) entram aqui: factory(engine, on_message, on_gap)
+# devolvendo um objeto com publish(message), start() e stop()
+CHANNELS = {"postgres": PostgresChannel}
+
+channel = None
+
+
+def start(engine: Engine):
+    global channel
+    if not ENABLED or CHANNEL == "local":
+        return
+    if CHANNEL not in CHANNELS:
+        raise ValueError(f"USER_CACHE_CHANNEL desconhecido: {CHANNEL}")
+    if CHANNEL == "postgres" and engine.dialect.name != "postgresql":
+        logger.warning("USER_CACHE_CHANNEL=postgres exige PostgreSQL; usando invalidação local")
+        return
+    channel = CHANNELS[CHANNEL](engine, _forget, _forget)
+    channel.start()
+
+
+def stop():
+    global channel
+    if channel is not None:
+        channel.stop()
+        channel = None
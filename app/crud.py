@@ -1,51 +1,221 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import select, desc
-from typing import Sequence, Optional
-from passlib.context import CryptContext
+import csv
+import io
+import secrets
+from datetime import date, datetime, timedelta, timezone
 
-import models, schemas
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import Integer, and_, any_, bindparam, case, delete, func, null, select, desc, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
+from typing import Sequence, Optional, Tuple
+
+import cache, hashing, models, rollups, schemas, search
+from pagination import decode_cursor, encode_cursor, keyset_after, parse_datetime, parse_decimal, split_page
+
+MAX_IDS = 500
+
+def _get_many(db: Session, model, ids: Sequence[int]) -> Tuple[list, list[int]]:
+    """Busca vários registros numa consulta; devolve (encontrados na ordem pedida, ids ausentes)."""
+    if not ids:
+        return [], []
+    found = {obj.id: obj for obj in db.scalars(select(model).where(_ids_condition(db, model, ids)))}
+    return [found[i] for i in ids if i in found], [i for i in ids if i not in found]
+
+def _ids_condition(db: Session, model, ids: Sequence[int]):
+    if db.get_bind().dialect.name == "postgresql":
+        # id = ANY(:ids): um único parâmetro, o texto da consulta não muda com a quantidade
+        return model.id == any_(bindparam("ids", list(ids), type_=postgresql.ARRAY(Integer)))
+    return model.id.in_(ids)
+
+def _check_required(columns, values: dict):
+    # null explícito numa coluna NOT NULL é erro do pedido (400), não do banco
+    required = [k for k, v in values.items() if v is None and not columns[k].nullable]
+    if required:
+        raise ValueError(f"Campos obrigatórios não podem ser nulos: {', '.join(required)}")
+
+def _is_unique_violation(error: IntegrityError, column: str) -> bool:
+    """Se o IntegrityError é de valor duplicado num índice único da coluna."""
+    orig = error.orig
+    if getattr(orig, "pgcode", None) is not None:
+        # psycopg2: 23505 = unique_violation; o DETAIL traz "Key (email)=(...)"
+        return orig.pgcode == "23505" and f"({column})=" in str(orig)
+    # sqlite3: "UNIQUE constraint failed: customers.email"
+    message = str(orig)
+    return message.startswith("UNIQUE constraint failed") and f".{column}" in message
+
+def _update(db: Session, model, obj_id: int, values: dict):
+    """UPDATE ... RETURNING numa única instrução; devolve None se o id não existir."""
+    columns = model.__table__.columns
+    values = {k: v for k, v in values.items() if k in columns}
+    _check_required(columns, values)
+    if not values:
+        return db.get(model, obj_id)
+    stmt = update(model).where(model.id == obj_id).values(**values).returning(model)
+    obj = db.scalars(stmt.execution_options(populate_existing=True)).first()
+    if obj is None:
+        db.rollback()
+        return None
+    db.commit()
+    return obj
+
+def _delete(db: Session, model, obj_id: int) -> bool:
+    # DELETE direto: filhos são removidos pelo ON DELETE CASCADE do banco,
+    # sem carregar os registros relacionados na sessão
+    deleted = db.execute(delete(model).where(model.id == obj_id)).rowcount
+    db.commit()
+    return deleted > 0
+
+def _insert(db: Session, model):
+    # INSERT com suporte a ON CONFLICT (PostgreSQL e SQLite >= 3.35 também têm RETURNING)
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
 
 # ----- Customers -----
 def create_customer(db: Session, data: schemas.CustomerCreate):
-    customer = models.Customer(**data.model_dump())
-    db.add(customer)
+    # Uma única instrução: a duplicidade é detectada pelo índice único de email,
+    # o que também vale sob concorrência (sem janela entre checagem e insert)
+    stmt = _insert(db, models.Customer).values(**data.model_dump()).on_conflict_do_nothing(
+        index_elements=[models.Customer.email]
+    ).returning(models.Customer)
+    customer = db.scalars(stmt).first()
+    if customer is None:
+        db.rollback()
+        raise ValueError("Email já cadastrado.")
     db.commit()
-    db.refresh(customer)
     return customer
 
-def list_customers(db: Session, q: Optional[str] = None, limit: int = 50, offset: int = 0) -> Sequence[models.Customer]:
-    stmt = select(models.Customer).order_by(desc(models.Customer.created_at)).limit(limit).offset(offset)
+def insert_customers(db: Session, rows: list[dict]) -> list[Optional[str]]:
+    """Insere vários clientes numa instrução, ignorando emails já cadastrados.
+
+    Devolve o email de cada linha inserida (None para clientes sem email); não faz commit.
+    """
+    if not rows:
+        return []
+    if db.get_bind().dialect.name == "postgresql":
+        return _copy_customers(db, rows)
+    # executemany: o SQLAlchemy agrupa as linhas em INSERTs de vários VALUES ("insertmanyvalues")
+    stmt = _insert(db, models.Customer.__table__).on_conflict_do_nothing(
+        index_elements=[models.Customer.email]
+    ).returning(models.Customer.email)
+    return list(db.connection().execute(stmt, rows).scalars())
+
+def _copy_customers(db: Session, rows: list[dict]) -> list[Optional[str]]:
+    # COPY não aceita ON CONFLICT: carrega numa tabela temporária e insere a partir dela
+    conn = db.connection()
+    conn.exec_driver_sql(
+        "CREATE TEMP TABLE IF NOT EXISTS customers_import "
+        "(pos integer, name varchar(150), email varchar(150), phone varchar(50), company varchar(150)) "
+        "ON COMMIT DELETE ROWS"
+    )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for pos, row in enumerate(rows):
+        # no formato csv do COPY, campo vazio sem aspas é NULL
+        writer.writerow([pos, row["name"], row["email"], row["phone"], row["company"]])
+    buffer.seek(0)
+    with conn.connection.cursor() as cursor:
+        cursor.copy_expert("COPY customers_import FROM STDIN WITH (FORMAT csv)", buffer)
+    result = conn.exec_driver_sql(
+        "INSERT INTO customers (name, email, phone, company) "
+        "SELECT name, email, phone, company FROM customers_import ORDER BY pos "
+        "ON CONFLICT (email) DO NOTHING RETURNING email"
+    )
+    emails = list(result.scalars())
+    conn.exec_driver_sql("TRUNCATE customers_import")
+    return emails
+
+def list_customers(
+    db: Session,
+    q: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+) -> Tuple[Sequence[models.Customer], Optional[str]]:
     if q:
-        q_like = f"%{q.lower()}%"
-        stmt = select(models.Customer).where(
-            (models.Customer.name.ilike(q_like)) |
-            (models.Customer.email.ilike(q_like)) |
-            (models.Customer.company.ilike(q_like))
-        ).order_by(desc(models.Customer.created_at)).limit(limit).offset(offset)
-    return db.scalars(stmt).all()
+        # busca ordenada por relevância: paginação apenas por offset
+        if cursor:
+            raise ValueError("Paginação por cursor não é suportada junto com q")
+        return search.search_customers(db, q, limit=limit, offset=offset), None
+    # Ordenação estável (created_at, id) para permitir paginação por cursor (keyset)
+    stmt = select(models.Customer).order_by(
+        desc(models.Customer.created_at), desc(models.Customer.id)
+    ).limit(limit + 1)
+    if cursor:
+        created_at, customer_id = decode_cursor(cursor, parse_datetime, int)
+        stmt = stmt.where(keyset_after(
+            (models.Customer.created_at, models.Customer.id), (created_at, customer_id)
+        ))
+    elif offset:
+        # offset mantido apenas por compatibilidade: páginas profundas ficam lentas
+        stmt = stmt.offset(offset)
+    customers, has_more = split_page(db.scalars(stmt).all(), limit)
+    next_cursor = None
+    if has_more:
+        last = customers[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return customers, next_cursor
 
 def get_customer(db: Session, customer_id: int) -> Optional[models.Customer]:
     return db.get(models.Customer, customer_id)
 
-def update_customer(db: Session, customer_id: int, data: schemas.CustomerUpdate) -> Optional[models.Customer]:
-    db_customer = db.get(models.Customer, customer_id)
-    if not db_customer:
+def get_customers_by_ids(db: Session, ids: Sequence[int]) -> Tuple[list[models.Customer], list[int]]:
+    return _get_many(db, models.Customer, ids)
+
+OPEN_STAGES = (models.OpportunityStage.new, models.OpportunityStage.qualified, models.OpportunityStage.proposal)
+
+def get_customer_overview(
+    db: Session, customer_id: int, interactions_limit: int = 10, opportunities_limit: int = 50
+) -> Optional[Tuple[models.Customer, Sequence[models.Interaction], list[models.Opportunity]]]:
+    # 1ª consulta: cliente + oportunidades abertas num único LEFT JOIN
+    rows = db.execute(
+        select(models.Customer, models.Opportunity)
+        .outerjoin(models.Opportunity, and_(
+            models.Opportunity.customer_id == models.Customer.id,
+            models.Opportunity.stage.in_(OPEN_STAGES),
+        ))
+        .where(models.Customer.id == customer_id)
+        .order_by(desc(models.Opportunity.created_at), desc(models.Opportunity.id))
+        .limit(opportunities_limit)
+    ).all()
+    if not rows:
         return None
-    update_data = data.model_dump(exclude_unset=True)
-    for k, v in update_data.items():
-        setattr(db_customer, k, v)
-    db.add(db_customer)
-    db.commit()
-    db.refresh(db_customer)
-    return db_customer
+    customer = rows[0][0]
+    opportunities = [opp for _, opp in rows if opp is not None]
+    # 2ª consulta: interações mais recentes
+    interactions, _ = list_interactions(db, customer_id, limit=interactions_limit)
+    return customer, interactions, opportunities
+
+def update_customer(db: Session, customer_id: int, data: schemas.CustomerUpdate) -> Optional[models.Customer]:
+    try:
+        return _update(db, models.Customer, customer_id, data.model_dump(exclude_unset=True))
+    except IntegrityError as e:
+        db.rollback()
+        if _is_unique_violation(e, "email"):
+            raise ValueError("Email já cadastrado.")
+        raise
 
 def delete_customer(db: Session, customer_id: int) -> bool:
-    customer = db.get(models.Customer, customer_id)
-    if not customer:
-        return False
-    db.delete(customer)
-    db.commit()
-    return True
+    return _delete(db, models.Customer, customer_id)
+
+PURGE_CHUNK_SIZE = 5000
+
+def purge_customer(db: Session, customer_id: int, chunk_size: int = PURGE_CHUNK_SIZE) -> bool:
+    """Remove um cliente grande em lotes, cada um na sua transação.
+
+    Evita uma única transação longa segurando locks sobre milhares de linhas.
+    """
+    for model in (models.Interaction, models.Opportunity):
+        while True:
+            chunk = select(model.id).where(model.customer_id == customer_id).limit(chunk_size)
+            deleted = db.execute(
+                delete(model).where(model.id.in_(chunk.scalar_subquery())),
+                execution_options={"synchronize_session": False},
+            ).rowcount
+            db.commit()
+            if deleted < chunk_size:
+                break
+    return delete_customer(db, customer_id)
 
 # ----- Interactions -----
 def create_interaction(db: Session, customer_id: int, data: schemas.InteractionCreate) -> models.Interaction:
@@ -55,19 +225,128 @@ def create_interaction(db: Session, customer_id: int, data: schemas.InteractionC
     db.refresh(interaction)
     return interaction
 
-def list_interactions(db: Session, customer_id: int, limit: int = 100, offset: int = 0):
-    stmt = select(models.Interaction).where(models.Interaction.customer_id == customer_id).order_by(
-        desc(models.Interaction.occurred_at)
-    ).limit(limit).offset(offset)
-    return db.scalars(stmt).all()
+def create_interactions(db: Session, rows: list[dict]) -> list[Optional[dict]]:
+    """Insere várias interações com um commit; None nas posições cujo cliente não existe."""
+    customer_ids = list({row["customer_id"] for row in rows})
+    existing = set(db.scalars(select(models.Customer.id).where(models.Customer.id.in_(customer_ids))))
+    valid = [row for row in rows if row["customer_id"] in existing]
+    created = iter(())
+    if valid:
+        table = models.Interaction.__table__
+        stmt = table.insert().returning(*table.c, sort_by_parameter_order=True)
+        created = iter([row._asdict() for row in db.execute(stmt, valid)])
+        db.commit()
+    return [next(created) if row["customer_id"] in existing else None for row in rows]
+
+MAX_ACTIVITY_BUCKETS = 1000
+
+def _bucket_start(day: date, bucket: str) -> date:
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())  # semanas começam na segunda-feira
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+def _next_bucket(start: date, bucket: str) -> date:
+    if bucket == "week":
+        return start + timedelta(days=7)
+    if bucket == "month":
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+def get_activity(db: Session, customer_id: int, date_from: date, date_to: date, bucket: str = "day") -> list[dict]:
+    """Interações por período entre date_from e date_to (inclusive), lidas do agregado
+    interaction_daily_counts; períodos sem interações vêm zerados."""
+    if date_from > date_to:
+        raise ValueError("from deve ser anterior ou igual a to")
+    buckets: dict[date, dict] = {}
+    start = _bucket_start(date_from, bucket)
+    while start <= date_to:
+        if len(buckets) >= MAX_ACTIVITY_BUCKETS:
+            raise ValueError(f"No máximo {MAX_ACTIVITY_BUCKETS} períodos por consulta")
+        buckets[start] = {"start": start, "total": 0, "by_type": {}}
+        start = _next_bucket(start, bucket)
+
+    counts = models.InteractionDailyCount
+    rows = db.execute(
+        select(counts.day, counts.type, counts.count).where(
+            counts.customer_id == customer_id,
+            counts.day >= date_from,
+            counts.day <= date_to,
+            counts.count != 0,
+        )
+    )
+    for day, type_, count in rows:
+        entry = buckets[_bucket_start(day, bucket)]
+        entry["total"] += count
+        entry["by_type"][type_] = entry["by_type"].get(type_, 0) + count
+    return list(buckets.values())
+
+NOTES_PREVIEW_LENGTH = 200
+
+def _interaction_columns(notes: str):
+    """Entidade completa ou só as colunas da linha do tempo, com notes truncado no banco
+    (notes="truncated") ou omitido (notes="none"); o corpo inteiro não sai do banco."""
+    if notes == "full":
+        return (models.Interaction,)
+    if notes == "none":
+        notes_column = null()
+    else:
+        # lê no máximo N + 1 caracteres: basta para saber se o texto foi cortado
+        preview = func.substr(models.Interaction.notes, 1, NOTES_PREVIEW_LENGTH + 1)
+        notes_column = case(
+            (func.length(preview) > NOTES_PREVIEW_LENGTH,
+             func.substr(models.Interaction.notes, 1, NOTES_PREVIEW_LENGTH) + "…"),
+            else_=preview,
+        )
+    return (
+        models.Interaction.id,
+        models.Interaction.customer_id,
+        models.Interaction.type,
+        models.Interaction.occurred_at,
+        notes_column.label("notes"),
+    )
+
+def list_interactions(
+    db: Session,
+    customer_id: int,
+    limit: int = 100,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    occurred_from: Optional[datetime] = None,
+    occurred_to: Optional[datetime] = None,
+    notes: str = "full",
+) -> Tuple[Sequence[models.Interaction], Optional[str]]:
+    # Servido pelo índice (customer_id, occurred_at DESC, id DESC), sem ordenação em memória
+    stmt = select(*_interaction_columns(notes)).where(models.Interaction.customer_id == customer_id).order_by(
+        desc(models.Interaction.occurred_at), desc(models.Interaction.id)
+    ).limit(limit + 1)
+    # filtros simples sobre occurred_at permitem ao PostgreSQL descartar partições
+    if occurred_from:
+        stmt = stmt.where(models.Interaction.occurred_at >= occurred_from)
+    if occurred_to:
+        stmt = stmt.where(models.Interaction.occurred_at < occurred_to)
+    if cursor:
+        occurred_at, interaction_id = decode_cursor(cursor, parse_datetime, int)
+        stmt = stmt.where(
+            models.Interaction.occurred_at <= occurred_at,
+            keyset_after((models.Interaction.occurred_at, models.Interaction.id), (occurred_at, interaction_id)),
+        )
+    elif offset:
+        stmt = stmt.offset(offset)
+    rows = db.scalars(stmt).all() if notes == "full" else db.execute(stmt).all()
+    interactions, has_more = split_page(rows, limit)
+    next_cursor = None
+    if has_more:
+        last = interactions[-1]
+        next_cursor = encode_cursor(last.occurred_at, last.id)
+    return interactions, next_cursor
+
+def get_interaction(db: Session, interaction_id: int) -> Optional[models.Interaction]:
+    return db.get(models.Interaction, interaction_id)
 
 def delete_interaction(db: Session, interaction_id: int) -> bool:
-    interaction = db.get(models.Interaction, interaction_id)
-    if not interaction:
-        return False
-    db.delete(interaction)
-    db.commit()
-    return True
+    return _delete(db, models.Interaction, interaction_id)
 
 # ----- Opportunities -----
 def create_opportunity(db: Session, customer_id: int, data: schemas.OpportunityCreate) -> models.Opportunity:
@@ -83,50 +362,179 @@ def list_opportunities(db: Session, customer_id: int, limit: int = 100, offset:
     ).limit(limit).offset(offset)
     return db.scalars(stmt).all()
 
-def list_all_opportunities(db: Session, limit: int = 100, offset: int = 0):
-    return db.query(models.Opportunity).order_by(desc(models.Opportunity.created_at)).offset(offset).limit(limit).all()
+# ordenação -> (coluna, parser do valor no cursor)
+OPPORTUNITY_SORTS = {
+    "created_at": (models.Opportunity.created_at, parse_datetime),
+    "value": (models.Opportunity.value, parse_decimal),
+    "close_date": (models.Opportunity.close_date, parse_datetime),
+}
+
+def _opportunity_conditions(filters: Optional[schemas.OpportunityFilter]) -> list:
+    """Condições WHERE comuns às consultas de oportunidades a partir de um filtro."""
+    if filters is None:
+        return []
+    opp = models.Opportunity
+    conditions = []
+    if filters.stage:
+        conditions.append(opp.stage.in_(filters.stage))
+    if filters.customer_id is not None:
+        conditions.append(opp.customer_id == filters.customer_id)
+    if filters.value_min is not None:
+        conditions.append(opp.value >= filters.value_min)
+    if filters.value_max is not None:
+        conditions.append(opp.value <= filters.value_max)
+    if filters.close_from is not None:
+        conditions.append(opp.close_date >= filters.close_from)
+    if filters.close_to is not None:
+        conditions.append(opp.close_date < filters.close_to)
+    return conditions
+
+def list_all_opportunities(
+    db: Session,
+    limit: int = 100,
+    offset: int = 0,
+    filters: Optional[schemas.OpportunityFilter] = None,
+    sort: str = "created_at",
+    descending: bool = True,
+    cursor: Optional[str] = None,
+) -> Tuple[Sequence[models.Opportunity], Optional[str]]:
+    # ORDER BY (coluna, id): cada combinação de filtro + ordenação tem um índice composto
+    # (models.py); ordenando por value ou close_date, linhas com o campo nulo ficam de fora
+    column, parse = OPPORTUNITY_SORTS[sort]
+    direction = "desc" if descending else "asc"
+    keys = (column, models.Opportunity.id)
+    stmt = select(models.Opportunity).where(*_opportunity_conditions(filters)).order_by(
+        *(key.desc() if descending else key.asc() for key in keys)
+    ).limit(limit + 1)
+    if sort != "created_at":
+        stmt = stmt.where(column.is_not(None))
+    if cursor:
+        cursor_sort, cursor_direction, value, opportunity_id = decode_cursor(cursor, str, str, parse, int)
+        if (cursor_sort, cursor_direction) != (sort, direction):
+            raise ValueError("Cursor de outra ordenação")
+        stmt = stmt.where(keyset_after(keys, (value, opportunity_id), descending=descending))
+    elif offset:
+        stmt = stmt.offset(offset)
+    opportunities, has_more = split_page(db.scalars(stmt).all(), limit)
+    next_cursor = None
+    if has_more:
+        last = opportunities[-1]
+        next_cursor = encode_cursor(sort, direction, getattr(last, sort), last.id)
+    return opportunities, next_cursor
+
+def get_board(
+    db: Session,
+    per_stage: int = 25,
+    filters: Optional[schemas.OpportunityFilter] = None,
+    sort: str = "value",
+    descending: bool = True,
+) -> list[dict]:
+    """Primeiras per_stage oportunidades de cada estágio e o total do estágio, numa consulta.
+
+    ROW_NUMBER()/COUNT() OVER (PARTITION BY stage); o cursor de cada coluna segue o formato
+    de list_all_opportunities, para "carregar mais" com stage=<estágio>.
+    """
+    opp = models.Opportunity
+    column, _ = OPPORTUNITY_SORTS[sort]
+    direction = "desc" if descending else "asc"
+    keys = (column, opp.id)
+    # sem o campo de ordenação a oportunidade conta no total, mas fica por último e fora da coluna
+    ranked = select(
+        opp,
+        func.row_number().over(
+            partition_by=opp.stage,
+            order_by=[column.is_(None), *(key.desc() if descending else key.asc() for key in keys)],
+        ).label("rn"),
+        func.count().over(partition_by=opp.stage).label("stage_count"),
+    ).where(*_opportunity_conditions(filters)).subquery()
+    board = aliased(opp, ranked)
+    stmt = select(board, ranked.c.stage_count).where(ranked.c.rn <= per_stage + 1).order_by(ranked.c.stage, ranked.c.rn)
+
+    columns = {
+        stage: {"stage": stage, "count": 0, "items": [], "next_cursor": None}
+        for stage in (filters.stage if filters and filters.stage else models.OpportunityStage)
+    }
+    for opportunity, stage_count in db.execute(stmt):
+        col = columns[opportunity.stage]
+        col["count"] = stage_count
+        if getattr(opportunity, sort) is not None:
+            col["items"].append(opportunity)
+    for col in columns.values():
+        col["items"], has_more = split_page(col["items"], per_stage)
+        if has_more:
+            last = col["items"][-1]
+            col["next_cursor"] = encode_cursor(sort, direction, getattr(last, sort), last.id)
+    return list(columns.values())
 
 def get_opportunity(db: Session, opportunity_id: int) -> Optional[models.Opportunity]:
     return db.get(models.Opportunity, opportunity_id)
 
+def get_opportunities_by_ids(db: Session, ids: Sequence[int]) -> Tuple[list[models.Opportunity], list[int]]:
+    return _get_many(db, models.Opportunity, ids)
+
 def update_opportunity(db: Session, opportunity_id: int, data: schemas.OpportunityUpdate) -> Optional[models.Opportunity]:
-    opp = db.get(models.Opportunity, opportunity_id)
-    if not opp:
-        return None
-    update_data = data.model_dump(exclude_unset=True)
-    for k, v in update_data.items():
-        setattr(opp, k, v)
-    db.add(opp)
-    db.commit()
-    db.refresh(opp)
-    return opp
+    return _update(db, models.Opportunity, opportunity_id, data.model_dump(exclude_unset=True))
 
 def delete_opportunity(db: Session, opportunity_id: int) -> bool:
-    opp = db.get(models.Opportunity, opportunity_id)
-    if not opp:
-        return False
-    db.delete(opp)
+    return _delete(db, models.Opportunity, opportunity_id)
+
+def bulk_update_opportunities(db: Session, data: schemas.OpportunityBulkUpdate) -> dict:
+    """Aplica changes às oportunidades de ids ou filter num único UPDATE.
+
+    Histórico de estágios e totais do pipeline ficam a cargo dos triggers (rollups.py).
+    """
+    opp = models.Opportunity
+    columns = opp.__table__.columns
+    values = {k: v for k, v in data.changes.model_dump(exclude_unset=True).items() if k in columns}
+    if not values:
+        raise ValueError("Nenhum campo para alterar")
+    _check_required(columns, values)
+    if (data.ids is None) == (data.filter is None):
+        raise ValueError("Informe ids ou filter")
+
+    stmt = update(opp).values(**values).execution_options(synchronize_session=False)
+    if data.ids is not None:
+        ids = list(dict.fromkeys(data.ids))
+        if not ids or len(ids) > MAX_IDS:
+            raise ValueError(f"Informe de 1 a {MAX_IDS} ids")
+        updated = set(db.scalars(stmt.where(_ids_condition(db, opp, ids)).returning(opp.id)))
+        db.commit()
+        return {"updated": len(updated), "missing_ids": [i for i in ids if i not in updated]}
+
+    conditions = _opportunity_conditions(data.filter)
+    if not conditions:
+        raise ValueError("filter vazio alteraria todas as oportunidades")
+    result = db.execute(stmt.where(*conditions))
     db.commit()
-    return True
+    return {"updated": result.rowcount, "missing_ids": []}
 
-# ----- Users -----
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+def get_pipeline(db: Session) -> list[dict]:
+    """Quantidade e soma de value por estágio, incluindo estágios vazios."""
+    if rollups.PIPELINE_SUMMARY:
+        totals = models.OpportunityStageTotal
+        stmt = select(totals.stage, totals.count, totals.total_value)
+    else:
+        opp = models.Opportunity
+        stmt = select(opp.stage, func.count(), func.coalesce(func.sum(opp.value), 0)).group_by(opp.stage)
+    found = {stage: (count, total) for stage, count, total in db.execute(stmt)}
+    return [
+        {"stage": stage, "count": found.get(stage, (0, 0))[0], "total_value": found.get(stage, (0, 0))[1]}
+        for stage in models.OpportunityStage
+    ]
 
-def create_user(db: Session, data: schemas.UserCreate):
-    # Verificar se usuário já existe
-    existing_user = db.query(models.User).filter(models.User.email == data.email).first()
-    if existing_user:
-        raise ValueError("Usuário com este email já existe")
-    
-    hashed_password = pwd_context.hash(data.password)
-    user = models.User(
-        email=data.email, 
+# ----- Users -----
+# hashed_password: hash já calculado fora (hashing.hasher, na API); sem ele o hash é feito aqui
+def create_user(db: Session, data: schemas.UserCreate, hashed_password: Optional[str] = None):
+    hashed_password = hashed_password or hashing.hash_password(data.password)
+    stmt = _insert(db, models.User).values(
+        email=data.email,
         hashed_password=hashed_password,
-        name=data.name if hasattr(data, 'name') else None
-    )
-    db.add(user)
+    ).on_conflict_do_nothing(index_elements=[models.User.email]).returning(models.User)
+    user = db.scalars(stmt).first()
+    if user is None:
+        db.rollback()
+        raise ValueError("Usuário com este email já existe")
     db.commit()
-    db.refresh(user)
     return user
 
 def list_users(db: Session, limit: int = 100, offset: int = 0):
@@ -135,36 +543,93 @@ def list_users(db: Session, limit: int = 100, offset: int = 0):
 def get_user(db: Session, user_id: int) -> Optional[models.User]:
     return db.query(models.User).filter(models.User.id == user_id).first()
 
+def get_users_by_ids(db: Session, ids: Sequence[int]) -> Tuple[list[models.User], list[int]]:
+    return _get_many(db, models.User, ids)
+
 def get_user_by_email(db: Session, email: str) -> Optional[models.User]:
     return db.query(models.User).filter(models.User.email == email).first()
 
-def update_user(db: Session, user_id: int, data: schemas.UserUpdate) -> Optional[models.User]:
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not db_user:
-        return None
-
+def update_user(
+    db: Session, user_id: int, data: schemas.UserUpdate, hashed_password: Optional[str] = None
+) -> Optional[models.User]:
     update_data = data.model_dump(exclude_unset=True)
-    
+
     # Se houver password no update, hash it
-    if 'password' in update_data and update_data['password']:
-        update_data['hashed_password'] = pwd_context.hash(update_data['password'])
-        del update_data['password']
-    
-    for key, value in update_data.items():
-        setattr(db_user, key, value)
-
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+    password = update_data.pop('password', None)
+    if password:
+        update_data['hashed_password'] = hashed_password or hashing.hash_password(password)
+
+    try:
+        user = _update(db, models.User, user_id, update_data)
+    except IntegrityError as e:
+        db.rollback()
+        if _is_unique_violation(e, "email"):
+            raise ValueError("Usuário com este email já existe")
+        raise
+    cache.invalidate_user(user_id)
+    return user
 
 def delete_user(db: Session, user_id: int) -> bool:
-    user = db.get(models.User, user_id)
-    if not user:
-        return False
-    db.delete(user)
+    deleted = _delete(db, models.User, user_id)
+    cache.invalidate_user(user_id)
+    return deleted
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return hashing.verify_password(plain_password, hashed_password)
+
+# ----- API keys -----
+API_KEY_PREFIX = "crm_"
+
+def create_api_key(db: Session, user_id: int, data: schemas.ApiKeyCreate) -> Tuple[models.ApiKey, str]:
+    """Gera a chave e guarda só o sha256; devolve (registro, chave em texto)."""
+    key = API_KEY_PREFIX + secrets.token_urlsafe(32)
+    stmt = _insert(db, models.ApiKey).values(
+        user_id=user_id, name=data.name, prefix=key[:12], key_hash=hashing.digest(key),
+    ).returning(models.ApiKey)
+    api_key = db.scalars(stmt).one()
     db.commit()
+    return api_key, key
+
+def list_api_keys(db: Session, user_id: int) -> Sequence[models.ApiKey]:
+    return db.scalars(select(models.ApiKey).where(models.ApiKey.user_id == user_id).order_by(models.ApiKey.id)).all()
+
+def delete_api_key(db: Session, user_id: int, api_key_id: int) -> bool:
+    stmt = delete(models.ApiKey).where(
+        models.ApiKey.id == api_key_id, models.ApiKey.user_id == user_id
+    ).returning(models.ApiKey.key_hash)
+    key_hash = db.scalar(stmt)
+    db.commit()
+    if key_hash is None:
+        return False
+    cache.invalidate_api_key(key_hash)
     return True
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+def get_api_key_user_id(db: Session, key_hash: str) -> Optional[int]:
+    # key_hash tem índice único: uma busca pontual
+    return db.scalar(select(models.ApiKey.user_id).where(models.ApiKey.key_hash == key_hash))
+
+# ----- Tokens revogados -----
+def revoke_token(db: Session, jti: str, user_id: int, expires_at: datetime) -> bool:
+    """Grava o jti como revogado; False se já estava (a chave primária decide, então
+    entre dois pedidos concorrentes só um consegue)."""
+    db.add(models.RevokedToken(jti=jti, user_id=user_id, expires_at=expires_at))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return False
+    return True
+
+def is_token_revoked(db: Session, jti: str) -> bool:
+    return db.scalar(select(models.RevokedToken.jti).where(models.RevokedToken.jti == jti)) is not None
+
+def list_revoked_jtis(db: Session) -> Sequence[str]:
+    """jti revogados de tokens que ainda não expiraram."""
+    now = datetime.now(timezone.utc)
+    return db.scalars(select(models.RevokedToken.jti).where(models.RevokedToken.expires_at > now)).all()
+
+def prune_revoked_tokens(db: Session) -> int:
+    """Apaga as revogações de tokens já expirados."""
+    result = db.execute(delete(models.RevokedToken).where(models.RevokedToken.expires_at <= datetime.now(timezone.utc)))
+    db.commit()
+    return result.rowcount
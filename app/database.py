@@ -1,6 +1,9 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.sql import functions
 import os
 
 # Configuração para Cloud SQL
@@ -20,7 +23,21 @@ engine = create_engine(
     max_overflow=10
 )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+@event.listens_for(engine, "connect")
+def _sqlite_foreign_keys(dbapi_connection, connection_record):
+    # O SQLite só aplica FKs (e o ON DELETE CASCADE) com este pragma ligado
+    if engine.dialect.name == "sqlite":
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+# expire_on_commit=False: objetos devolvidos por INSERT/UPDATE ... RETURNING continuam
+# utilizáveis após o commit sem um SELECT extra para recarregá-los
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+# No SQLite, CURRENT_TIMESTAMP grava "YYYY-MM-DD HH:MM:SS", formato diferente do usado
+# pelo SQLAlchemy nos parâmetros; comparações (ex.: cursores) precisam do mesmo formato
+@compiles(functions.now, "sqlite")
+def _sqlite_now(element, compiler, **kw):
+    return "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
 
 class Base(DeclarativeBase):
     pass
@@ -30,4 +47,12 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def init_db():
+    # create_all não cria índices novos em tabelas que já existem
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
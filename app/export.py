@@ -0,0 +1,87 @@
+# app/export.py
+# Exportação completa de tabelas (GET /export/{resource}) em NDJSON ou CSV.
+# As linhas são lidas com cursor do lado do servidor (yield_per/stream_results) e
+# enviadas em lotes, então a memória usada não depende do tamanho da tabela.
+import csv
+import enum
+import io
+import json
+import zlib
+from datetime import datetime
+from decimal import Decimal
+from typing import Iterator
+
+from sqlalchemy import select
+
+import models
+from database import SessionLocal
+
+BATCH_SIZE = 1000
+
+RESOURCES = {
+    "customers": models.Customer,
+    "interactions": models.Interaction,
+    "opportunities": models.Opportunity,
+}
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _plain(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _batches(resource: str) -> Iterator[list]:
+    table = RESOURCES[resource].__table__
+    # Sessão própria: o StreamingResponse continua lendo depois que as
+    # dependências da rota (get_db) já foram finalizadas
+    db = SessionLocal()
+    try:
+        stmt = select(table).order_by(table.c.id).execution_options(yield_per=BATCH_SIZE)
+        for partition in db.execute(stmt).partitions():
+            yield partition
+    finally:
+        db.close()
+
+
+def _ndjson(resource: str) -> Iterator[bytes]:
+    for rows in _batches(resource):
+        yield "".join(
+            json.dumps({k: _plain(v) for k, v in row._mapping.items()}, ensure_ascii=False) + "\n"
+            for row in rows
+        ).encode()
+
+
+def _csv(resource: str) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(RESOURCES[resource].__table__.columns.keys())
+    for rows in _batches(resource):
+        writer.writerows([_plain(v) for v in row] for row in rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _gzip(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        # Z_SYNC_FLUSH: o cliente recebe cada lote comprimido sem esperar o fim
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def stream(resource: str, fmt: str = "ndjson", gzip: bool = False) -> Iterator[bytes]:
+    chunks = _csv(resource) if fmt == "csv" else _ndjson(resource)
+    return _gzip(chunks) if gzip else chunks
@@ -0,0 +1,114 @@
+# app/hashing.py
+# Hash e verificação de senha (bcrypt) num pool de processos dedicado.
+#
+# bcrypt é lento de propósito (~0,2 s por operação). Rodando dentro de endpoints
+# síncronos, cada login ocupa uma das 40 threads do AnyIO, e uma rajada de logins
+# deixa o resto da API esperando thread livre. Aqui o trabalho vai para
+# PASSWORD_HASH_WORKERS processos; o endpoint só aguarda o resultado, sem ocupar
+# thread. Com mais de PASSWORD_HASH_MAX_PENDING operações pendentes (rodando ou na
+# fila), novas chamadas falham na hora com Overloaded (503 na API) em vez de esperar.
+#
+# Os processos são criados com "spawn": fork de um processo com threads e conexões
+# abertas (buffer de escrita, pool do SQLAlchemy) não é seguro. Por isso este módulo
+# só importa passlib, e os workers não carregam o resto da aplicação.
+import asyncio
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+
+WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+# prioridade menor (nice) para os workers: com CPU disputada, o atendimento das
+# requisições passa na frente do bcrypt
+WORKER_NICE = int(os.getenv("PASSWORD_HASH_NICE", "10"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class Overloaded(Exception):
+    pass
+
+
+# ----- Executadas nos workers (e direto, fora da API) -----
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def digest(secret: str) -> str:
+    """sha256 em hex. Basta para segredos aleatórios longos (chaves de API), que não
+    precisam do custo do bcrypt: não há dicionário que adivinhe 256 bits."""
+    return hashlib.sha256(secret.encode()).hexdigest()
+
+
+def _init_worker(nice: int):
+    if nice and hasattr(os, "nice"):
+        os.nice(nice)
+
+
+def _warm_up() -> str:
+    # carrega o backend do bcrypt no worker
+    return pwd_context.handler("bcrypt").get_backend()
+
+
+# ----- Pool -----
+class PasswordHasher:
+    def __init__(self, workers: int = WORKERS, max_pending: int = MAX_PENDING, nice: int = WORKER_NICE):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.nice = nice
+        self.pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    def start(self):
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.nice,),
+        )
+        # sobe os workers agora, não no primeiro login
+        for future in [self._executor.submit(_warm_up) for _ in range(self.workers)]:
+            future.result()
+
+    def stop(self):
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def saturated(self) -> bool:
+        return self.pending >= self.max_pending
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def _run(self, fn, *args):
+        # pending só muda no event loop, não precisa de lock
+        if self.saturated:
+            raise Overloaded("Muitas operações de senha em andamento")
+        self.pending += 1
+        try:
+            if self._executor is None:
+                # pool não iniciado (scripts, testes): roda numa thread
+                return await asyncio.to_thread(fn, *args)
+            return await asyncio.wrap_future(self._executor.submit(fn, *args))
+        finally:
+            self.pending -= 1
+
+
+hasher = PasswordHasher()
@@ -1,18 +1,42 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
+import asyncio
+import logging
+
+from fastapi import BackgroundTasks, FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Literal, Optional
 from fastapi.security import OAuth2PasswordRequestForm
 import models
-from database import Base, engine, get_db
+from database import Base, SessionLocal, engine, get_db, init_db
 
 # CORREÇÃO: Remover importações relativas, usar absolutas
+import analytics
 import auth
  
+import bulk
+import cache
 import crud
+import export
+import hashing
+import partitions
+import ratelimit
+import revocation
+import rollups
 import schemas
+import search
+import writebuffer
 import models
+from pagination import NEXT_CURSOR_HEADER
 from fastapi.middleware.cors import CORSMiddleware
 
+MISSING_IDS_HEADER = "X-Missing-Ids"
+WRITE_BUFFER_WAIT_SECONDS = 10
+ACTIVITY_DEFAULT_DAYS = 90
+FUNNEL_DEFAULT_DAYS = 90
+BOARD_DEFAULT_PER_STAGE = 25
+
 app = FastAPI(title="CRM Simples", version="0.1.0")
 
 # Cria as tabelas automaticamente (para protótipo)
@@ -25,8 +49,30 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, MISSING_IDS_HEADER],
 )
 
+def parse_ids(ids: Optional[str]) -> Optional[List[int]]:
+    """Converte "1,2,3" em [1, 2, 3] (sem repetições, mantendo a ordem)."""
+    if ids is None:
+        return None
+    try:
+        parsed = list(dict.fromkeys(int(part) for part in ids.split(",") if part.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids deve ser uma lista de inteiros separados por vírgula")
+    if len(parsed) > crud.MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"No máximo {crud.MAX_IDS} ids por requisição")
+    return parsed
+
+
+def set_missing_ids(response: Response, missing: List[int]):
+    if missing:
+        response.headers[MISSING_IDS_HEADER] = ",".join(map(str, missing))
+
+
+IDS_DESCRIPTION = f"Lista de ids separados por vírgula; ids inexistentes vêm em {MISSING_IDS_HEADER}"
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
@@ -36,21 +82,44 @@ def health():
 # ============================================
 @app.post("/customers", response_model=schemas.CustomerOut, status_code=201)
 def create_customer(payload: schemas.CustomerCreate, db: Session = Depends(get_db)):
-    if payload.email:
-        existing = crud.list_customers(db, q=payload.email, limit=1, offset=0)
-        if any(c.email == payload.email for c in existing):
-            raise HTTPException(status_code=400, detail="Email já cadastrado.")
-    return crud.create_customer(db, payload)
+    try:
+        return crud.create_customer(db, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/customers/bulk", response_model=schemas.BulkImportResult)
+async def bulk_import_customers(request: Request, db: Session = Depends(get_db)):
+    """Importa clientes em NDJSON (application/x-ndjson) ou CSV (text/csv, com cabeçalho)."""
+    fmt = bulk.detect_format(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Use application/x-ndjson ou text/csv")
+    # o corpo é lido em streaming pela thread que valida e insere os lotes
+    return await run_in_threadpool(bulk.import_customers, db, bulk.iter_body(request.stream()), fmt)
 
 
 @app.get("/customers", response_model=List[schemas.CustomerOut])
 def list_customers(
-    q: Optional[str] = Query(default=None, description="Busca por nome/email/empresa"),
+    response: Response,
+    q: Optional[str] = Query(default=None, description="Busca por nome/email/empresa (ignora acentos)"),
     limit: int = Query(default=50, ge=1, le=200),
-    offset: int = Query(default=0, ge=0),
+    offset: int = Query(default=0, ge=0, description="Obsoleto: prefira cursor"),
+    cursor: Optional[str] = Query(default=None, description=f"Valor de {NEXT_CURSOR_HEADER} da página anterior"),
+    ids: Optional[str] = Query(default=None, description=IDS_DESCRIPTION),
     db: Session = Depends(get_db)
 ):
-    return crud.list_customers(db, q=q, limit=limit, offset=offset)
+    id_list = parse_ids(ids)
+    if id_list is not None:
+        customers, missing = crud.get_customers_by_ids(db, id_list)
+        set_missing_ids(response, missing)
+        return customers
+    try:
+        customers, next_cursor = crud.list_customers(db, q=q, limit=limit, offset=offset, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return customers
 
 
 @app.get("/customers/{customer_id}", response_model=schemas.CustomerOut)
@@ -61,16 +130,56 @@ def get_customer(customer_id: int, db: Session = Depends(get_db)):
     return customer
 
 
+@app.get("/customers/{customer_id}/overview", response_model=schemas.CustomerOverview)
+def get_customer_overview(
+    customer_id: int,
+    interactions_limit: int = Query(default=10, ge=0, le=100),
+    opportunities_limit: int = Query(default=50, ge=1, le=200),
+    db: Session = Depends(get_db),
+):
+    """Cliente + interações recentes + oportunidades abertas, em duas consultas."""
+    overview = crud.get_customer_overview(db, customer_id, interactions_limit, opportunities_limit)
+    if not overview:
+        raise HTTPException(status_code=404, detail="Cliente não encontrado")
+    customer, interactions, opportunities = overview
+    return schemas.CustomerOverview(
+        **schemas.CustomerOut.model_validate(customer).model_dump(),
+        interactions=[schemas.InteractionOut.model_validate(i) for i in interactions],
+        open_opportunities=[schemas.OpportunityOut.model_validate(o) for o in opportunities],
+    )
+
+
 @app.put("/customers/{customer_id}", response_model=schemas.CustomerOut)
 def update_customer(customer_id: int, payload: schemas.CustomerUpdate, db: Session = Depends(get_db)):
-    db_customer = crud.get_customer(db, customer_id)
-    if not db_customer:
+    try:
+        updated = crud.update_customer(db, customer_id, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not updated:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
-    return crud.update_customer(db, customer_id, payload)
+    return updated
+
+
+def purge_customer_task(customer_id: int):
+    db = SessionLocal()
+    try:
+        crud.purge_customer(db, customer_id)
+    finally:
+        db.close()
 
 
 @app.delete("/customers/{customer_id}", status_code=204)
-def delete_customer(customer_id: int, db: Session = Depends(get_db)):
+def delete_customer(
+    customer_id: int,
+    background_tasks: BackgroundTasks,
+    purge: bool = Query(default=False, description="Remove em lotes, em segundo plano (clientes com muitos registros)"),
+    db: Session = Depends(get_db),
+):
+    if purge:
+        if not crud.get_customer(db, customer_id):
+            raise HTTPException(status_code=404, detail="Cliente não encontrado")
+        background_tasks.add_task(purge_customer_task, customer_id)
+        return JSONResponse(status_code=202, content={"detail": "Remoção agendada"})
     ok = crud.delete_customer(db, customer_id)
     if not ok:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
@@ -79,18 +188,123 @@ def delete_customer(customer_id: int, db: Session = Depends(get_db)):
 # ============================================
 # INTERACTIONS
 # ============================================
-@app.post("/customers/{customer_id}/interactions", response_model=schemas.InteractionOut, status_code=201)
-def create_interaction(customer_id: int, payload: schemas.InteractionCreate, db: Session = Depends(get_db)):
+@app.post(
+    "/customers/{customer_id}/interactions",
+    response_model=schemas.InteractionOut,
+    status_code=201,
+    responses={202: {"description": "Aceita no buffer de escrita (INTERACTION_WRITE_BUFFER), ainda não gravada"}},
+)
+def create_interaction(
+    customer_id: int,
+    payload: schemas.InteractionCreate,
+    wait: bool = Query(default=False, description="Com o buffer de escrita ativo, responder só após o commit"),
+    db: Session = Depends(get_db),
+):
+    if writebuffer.buffer.running:
+        try:
+            future = writebuffer.buffer.submit(customer_id, payload, flush_now=wait)
+        except writebuffer.BufferFull as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        if not wait:
+            return JSONResponse(status_code=202, content={"status": "accepted"})
+        try:
+            return future.result(timeout=WRITE_BUFFER_WAIT_SECONDS)
+        except LookupError:
+            raise HTTPException(status_code=404, detail="Cliente não encontrado")
+        except TimeoutError:
+            raise HTTPException(status_code=504, detail="Tempo esgotado aguardando a gravação")
     if not crud.get_customer(db, customer_id):
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
     return crud.create_interaction(db, customer_id, payload)
 
 
 @app.get("/customers/{customer_id}/interactions", response_model=List[schemas.InteractionOut])
-def list_interactions(customer_id: int, limit: int = 100, offset: int = 0, db: Session = Depends(get_db)):
-    if not crud.get_customer(db, customer_id):
+def list_interactions(
+    customer_id: int,
+    response: Response,
+    limit: int = Query(default=100, ge=1, le=200),
+    offset: int = Query(default=0, ge=0, description="Obsoleto: prefira cursor"),
+    cursor: Optional[str] = Query(default=None, description=f"Valor de {NEXT_CURSOR_HEADER} da página anterior"),
+    occurred_from: Optional[datetime] = Query(default=None, description="Interações a partir desta data (inclusive)"),
+    occurred_to: Optional[datetime] = Query(default=None, description="Interações antes desta data"),
+    notes: Literal["full", "truncated", "none"] = Query(
+        default="full",
+        description=f"truncated: até {crud.NOTES_PREVIEW_LENGTH} caracteres (terminando em … se cortado); "
+                    "none: sem notas. O texto completo fica em GET /interactions/{id}",
+    ),
+    db: Session = Depends(get_db),
+):
+    try:
+        interactions, next_cursor = crud.list_interactions(
+            db, customer_id, limit=limit, offset=offset, cursor=cursor,
+            occurred_from=occurred_from, occurred_to=occurred_to, notes=notes,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # a existência do cliente só precisa ser verificada quando a página vem vazia
+    if not interactions and not crud.get_customer(db, customer_id):
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
-    return crud.list_interactions(db, customer_id, limit=limit, offset=offset)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return interactions
+
+
+@app.get("/customers/{customer_id}/activity", response_model=List[schemas.ActivityBucket])
+def get_customer_activity(
+    customer_id: int,
+    date_from: Optional[date] = Query(default=None, alias="from", description="Padrão: 90 dias antes de to"),
+    date_to: Optional[date] = Query(default=None, alias="to", description="Padrão: hoje (UTC)"),
+    bucket: Literal["day", "week", "month"] = Query(default="day"),
+    db: Session = Depends(get_db),
+):
+    """Quantidade de interações por dia, semana ou mês (UTC), incluindo períodos vazios."""
+    date_to = date_to or datetime.now(timezone.utc).date()
+    date_from = date_from or date_to - timedelta(days=ACTIVITY_DEFAULT_DAYS)
+    try:
+        activity = crud.get_activity(db, customer_id, date_from, date_to, bucket)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not any(entry["total"] for entry in activity) and not crud.get_customer(db, customer_id):
+        raise HTTPException(status_code=404, detail="Cliente não encontrado")
+    return activity
+
+
+@app.get("/interactions/search", response_model=List[schemas.InteractionSearchHit])
+def search_interactions(
+    response: Response,
+    q: str = Query(min_length=1, description="Termos buscados nas notas (ignora acentos; prefixos valem)"),
+    customer_id: Optional[int] = Query(default=None),
+    type: Optional[str] = Query(default=None),
+    occurred_from: Optional[datetime] = Query(default=None, description="Interações a partir desta data (inclusive)"),
+    occurred_to: Optional[datetime] = Query(default=None, description="Interações antes desta data"),
+    limit: int = Query(default=50, ge=1, le=200),
+    cursor: Optional[str] = Query(default=None, description=f"Valor de {NEXT_CURSOR_HEADER} da página anterior"),
+    db: Session = Depends(get_db),
+):
+    """Busca nas notas das interações, das mais relevantes para as menos relevantes."""
+    try:
+        hits, next_cursor = search.search_interactions(
+            db, q, limit=limit, cursor=cursor, customer_id=customer_id, type=type,
+            occurred_from=occurred_from, occurred_to=occurred_to,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return [
+        schemas.InteractionSearchHit(
+            **schemas.InteractionOut.model_validate(interaction).model_dump(), score=score, snippet=snippet
+        )
+        for interaction, score, snippet in hits
+    ]
+
+
+@app.get("/interactions/{interaction_id}", response_model=schemas.InteractionOut)
+def get_interaction(interaction_id: int, db: Session = Depends(get_db)):
+    interaction = crud.get_interaction(db, interaction_id)
+    if not interaction:
+        raise HTTPException(status_code=404, detail="Interação não encontrada")
+    return interaction
 
 
 @app.delete("/interactions/{interaction_id}", status_code=204)
@@ -117,6 +331,66 @@ def list_opportunities(customer_id: int, limit: int = 100, offset: int = 0, db:
     return crud.list_opportunities(db, customer_id, limit=limit, offset=offset)
 
 
+def opportunity_filters(
+    stage: Optional[List[models.OpportunityStage]] = Query(default=None, description="Pode ser repetido"),
+    customer_id: Optional[int] = Query(default=None),
+    value_min: Optional[float] = Query(default=None),
+    value_max: Optional[float] = Query(default=None),
+    close_from: Optional[datetime] = Query(default=None, description="close_date a partir desta data (inclusive)"),
+    close_to: Optional[datetime] = Query(default=None, description="close_date antes desta data"),
+) -> schemas.OpportunityFilter:
+    return schemas.OpportunityFilter(
+        stage=stage, customer_id=customer_id, value_min=value_min, value_max=value_max,
+        close_from=close_from, close_to=close_to,
+    )
+
+
+@app.get("/opportunities/pipeline", response_model=List[schemas.PipelineStage])
+def get_pipeline(db: Session = Depends(get_db)):
+    """Quantidade e valor total das oportunidades por estágio."""
+    return crud.get_pipeline(db)
+
+
+@app.get("/opportunities/funnel", response_model=schemas.Funnel)
+def get_funnel(
+    date_from: Optional[datetime] = Query(default=None, alias="from", description="Padrão: 90 dias antes de to"),
+    date_to: Optional[datetime] = Query(default=None, alias="to", description="Padrão: agora (exclusivo)"),
+    db: Session = Depends(get_db),
+):
+    """Conversão, tempo mediano em cada estágio e velocidade das oportunidades que
+    entraram em cada estágio na janela [from, to)."""
+    date_to = date_to or datetime.now(timezone.utc)
+    date_from = date_from or date_to - timedelta(days=FUNNEL_DEFAULT_DAYS)
+    try:
+        return analytics.funnel(db, date_from, date_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/opportunities/board", response_model=List[schemas.BoardColumn])
+def get_board(
+    per_stage: int = Query(default=BOARD_DEFAULT_PER_STAGE, ge=1, le=200),
+    filters: schemas.OpportunityFilter = Depends(opportunity_filters),
+    sort: Literal["value", "close_date", "created_at"] = Query(
+        default="value", description="Por value ou close_date, oportunidades sem o campo contam em count mas não aparecem"
+    ),
+    order: Literal["asc", "desc"] = Query(default="desc"),
+    db: Session = Depends(get_db),
+):
+    """Primeiras per_stage oportunidades e total de cada estágio, numa consulta.
+    next_cursor de cada coluna continua em GET /opportunities?stage=...&sort=...&order=...&cursor=..."""
+    return crud.get_board(db, per_stage=per_stage, filters=filters, sort=sort, descending=order == "desc")
+
+
+@app.patch("/opportunities/bulk", response_model=schemas.OpportunityBulkResult)
+def bulk_update_opportunities(payload: schemas.OpportunityBulkUpdate, db: Session = Depends(get_db)):
+    """Altera as oportunidades de ids (até crud.MAX_IDS) ou de filter numa única instrução."""
+    try:
+        return crud.bulk_update_opportunities(db, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.get("/opportunities/{opportunity_id}", response_model=schemas.OpportunityOut)
 def get_opportunity(opportunity_id: int, db: Session = Depends(get_db)):
     opp = crud.get_opportunity(db, opportunity_id)
@@ -126,13 +400,42 @@ def get_opportunity(opportunity_id: int, db: Session = Depends(get_db)):
 
 
 @app.get("/opportunities", response_model=List[schemas.OpportunityOut])
-def list_all_opportunities(limit: int = 100, offset: int = 0, db: Session = Depends(get_db)):
-    return crud.list_all_opportunities(db, limit=limit, offset=offset)
+def list_all_opportunities(
+    response: Response,
+    limit: int = Query(default=100, ge=1, le=200),
+    offset: int = Query(default=0, ge=0, description="Obsoleto: prefira cursor"),
+    ids: Optional[str] = Query(default=None, description=IDS_DESCRIPTION),
+    filters: schemas.OpportunityFilter = Depends(opportunity_filters),
+    sort: Literal["created_at", "value", "close_date"] = Query(
+        default="created_at", description="Por value ou close_date, oportunidades sem o campo não aparecem"
+    ),
+    order: Literal["asc", "desc"] = Query(default="desc"),
+    cursor: Optional[str] = Query(default=None, description=f"Valor de {NEXT_CURSOR_HEADER} da página anterior"),
+    db: Session = Depends(get_db),
+):
+    id_list = parse_ids(ids)
+    if id_list is not None:
+        opportunities, missing = crud.get_opportunities_by_ids(db, id_list)
+        set_missing_ids(response, missing)
+        return opportunities
+    try:
+        opportunities, next_cursor = crud.list_all_opportunities(
+            db, limit=limit, offset=offset, filters=filters, sort=sort,
+            descending=order == "desc", cursor=cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return opportunities
 
 
 @app.put("/opportunities/{opportunity_id}", response_model=schemas.OpportunityOut)
 def update_opportunity(opportunity_id: int, payload: schemas.OpportunityUpdate, db: Session = Depends(get_db)):
-    updated = crud.update_opportunity(db, opportunity_id, payload)
+    try:
+        updated = crud.update_opportunity(db, opportunity_id, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not updated:
         raise HTTPException(status_code=404, detail="Oportunidade não encontrada")
     return updated
@@ -145,19 +448,68 @@ def delete_opportunity(opportunity_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Oportunidade não encontrada")
     return
 
+# ============================================
+# EXPORT
+# ============================================
+@app.get("/export/{resource}")
+def export_resource(
+    resource: str,
+    format: Literal["ndjson", "csv"] = Query(default="ndjson"),
+    gzip: bool = Query(default=False, description="Comprime a resposta (Content-Encoding: gzip)"),
+):
+    if resource not in export.RESOURCES:
+        raise HTTPException(status_code=404, detail="Recurso não encontrado")
+    filename = f"{resource}.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export.stream(resource, format, gzip),
+        media_type=export.MEDIA_TYPES[format],
+        headers=headers,
+    )
+
 # ============================================
 # USERS
 # ============================================
-@app.post("/users", response_model=schemas.UserOut, status_code=201)
-def create_user(payload: schemas.UserCreate, db: Session = Depends(get_db)):
+async def password_work(operation, *args):
+    """Hash/verificação no pool de processos (hashing.py); 503 se o pool estiver saturado."""
     try:
-        return crud.create_user(db, payload)
+        return await operation(*args)
+    except hashing.Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+
+async def password_capacity():
+    # async e declarada na rota: recusa antes de abrir sessão no banco ou ocupar thread
+    if hashing.hasher.saturated:
+        raise HTTPException(
+            status_code=503, detail="Muitas operações de senha em andamento", headers={"Retry-After": "1"}
+        )
+
+
+@app.post("/users", response_model=schemas.UserOut, status_code=201, dependencies=[Depends(password_capacity)])
+async def create_user(payload: schemas.UserCreate, db: Session = Depends(get_db)):
+    hashed_password = await password_work(hashing.hasher.hash, payload.password)
+    try:
+        return await run_in_threadpool(crud.create_user, db, payload, hashed_password)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.get("/users", response_model=List[schemas.UserOut])
-def list_users(limit: int = 100, offset: int = 0, db: Session = Depends(get_db)):
+def list_users(
+    response: Response,
+    limit: int = 100,
+    offset: int = 0,
+    ids: Optional[str] = Query(default=None, description=IDS_DESCRIPTION),
+    db: Session = Depends(get_db),
+):
+    id_list = parse_ids(ids)
+    if id_list is not None:
+        users, missing = crud.get_users_by_ids(db, id_list)
+        set_missing_ids(response, missing)
+        return users
     return crud.list_users(db, limit=limit, offset=offset)
 
 
@@ -170,8 +522,14 @@ def get_user(user_id: int, db: Session = Depends(get_db)):
 
 
 @app.put("/users/{user_id}", response_model=schemas.UserOut)
-def update_user(user_id: int, payload: schemas.UserUpdate, db: Session = Depends(get_db)):
-    updated = crud.update_user(db, user_id, payload)
+async def update_user(user_id: int, payload: schemas.UserUpdate, db: Session = Depends(get_db)):
+    hashed_password = None
+    if payload.password:
+        hashed_password = await password_work(hashing.hasher.hash, payload.password)
+    try:
+        updated = await run_in_threadpool(crud.update_user, db, user_id, payload, hashed_password)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not updated:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
     return updated
@@ -187,13 +545,58 @@ def delete_user(user_id: int, db: Session = Depends(get_db)):
 # ============================================
 # AUTH
 # ============================================
-@app.post("/token")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = crud.get_user_by_email(db, form_data.username)
-    if not user or not crud.verify_password(form_data.password, user.hashed_password):
+def load_credentials(db: Session, email: str) -> Optional[models.User]:
+    user = crud.get_user_by_email(db, email)
+    # devolve a conexão ao pool antes do bcrypt: logins esperando o hash não podem
+    # segurar as conexões (e as threads) de que o resto da API precisa
+    db.close()
+    return user
+
+
+async def login_rate_limit(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    # async e antes de password_capacity: a tentativa barrada não usa banco, thread nem bcrypt
+    if not ratelimit.ENABLED:
+        return
+    try:
+        ratelimit.login.check(request.client.host if request.client else None, form_data.username)
+    except ratelimit.RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+@app.post("/token", response_model=schemas.Token, dependencies=[Depends(login_rate_limit), Depends(password_capacity)])
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    # async: a thread só é usada na consulta; o bcrypt roda no pool de processos
+    user = await run_in_threadpool(load_credentials, db, form_data.username)
+    if not user or not await password_work(hashing.hasher.verify, form_data.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Email ou senha incorretos")
-    access_token = auth.create_access_token(data={"sub": str(user.id)})
-    return {"access_token": access_token, "token_type": "bearer"}
+    return auth.create_token_pair(user.id)
+
+
+def token_expires_at(claims: dict) -> datetime:
+    return datetime.fromtimestamp(claims["exp"], timezone.utc)
+
+
+@app.post("/token/refresh", response_model=schemas.Token)
+def refresh_token(payload: schemas.TokenRefresh, db: Session = Depends(get_db)):
+    """Troca o refresh token por um par novo, sem senha. O refresh token usado fica
+    revogado: cada um vale uma vez."""
+    claims = auth.decode_token(payload.refresh_token, "refresh")
+    if crud.get_user(db, claims["sub"]) is None:
+        raise HTTPException(status_code=401, detail="Credenciais inválidas")
+    if not revocation.revoked.revoke(db, claims["jti"], claims["sub"], token_expires_at(claims)):
+        raise HTTPException(status_code=401, detail="Refresh token já usado ou revogado")
+    return auth.create_token_pair(claims["sub"])
+
+
+@app.post("/token/revoke", status_code=204)
+def revoke_token(payload: schemas.TokenRevoke, db: Session = Depends(get_db)):
+    """Revoga um access ou refresh token (logout). Como na RFC 7009, um token inválido
+    ou já revogado também recebe 204."""
+    try:
+        claims = auth.decode_token(payload.token, "access", "refresh")
+    except HTTPException:
+        return
+    revocation.revoked.revoke(db, claims["jti"], claims["sub"], token_expires_at(claims))
 
 
 @app.get("/me")
@@ -201,11 +604,74 @@ def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
     return {"email": current_user.email, "id": current_user.id, "name": current_user.name}
 
 
+# ============================================
+# API KEYS
+# ============================================
+@app.post("/api-keys", response_model=schemas.ApiKeyCreated, status_code=201)
+def create_api_key(
+    payload: schemas.ApiKeyCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    """Cria uma chave para o usuário do token. A chave só aparece nesta resposta."""
+    api_key, key = crud.create_api_key(db, current_user.id, payload)
+    return schemas.ApiKeyCreated(**schemas.ApiKeyOut.model_validate(api_key).model_dump(), key=key)
+
+
+@app.get("/api-keys", response_model=List[schemas.ApiKeyOut])
+def list_api_keys(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user_or_api_key),
+):
+    return crud.list_api_keys(db, current_user.id)
+
+
+@app.delete("/api-keys/{api_key_id}", status_code=204)
+def delete_api_key(
+    api_key_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user_or_api_key),
+):
+    if not crud.delete_api_key(db, current_user.id, api_key_id):
+        raise HTTPException(status_code=404, detail="Chave não encontrada")
+
+
 
 #------garantia banco nuvem -----
  
+async def maintain_partitions_periodically():
+    while True:
+        await asyncio.sleep(partitions.MAINTENANCE_INTERVAL_SECONDS)
+        try:
+            await run_in_threadpool(partitions.maintain)
+        except Exception:
+            logging.exception("Falha na manutenção das partições de interactions")
+
+
 @app.on_event("startup")
 def startup_event():
-    # Criar tabelas se não existirem
-    Base.metadata.create_all(bind=engine)
-    print("✅ Tabelas do PostgreSQL criadas/validadas")
\ No newline at end of file
+    # Criar tabelas (e índices novos) se não existirem
+    init_db()
+    search.install(engine)
+    rollups.install(engine)
+    if models.INTERACTIONS_PARTITIONED:
+        partitions.maintain()
+        app.state.partition_maintenance = asyncio.get_event_loop().create_task(maintain_partitions_periodically())
+    if writebuffer.ENABLED:
+        writebuffer.buffer.start()
+    hashing.hasher.start()
+    cache.start(engine)
+    revocation.revoked.start()
+    print("✅ Tabelas do PostgreSQL criadas/validadas")
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    # grava as interações que ainda estão no buffer antes de encerrar
+    writebuffer.buffer.stop()
+    hashing.hasher.stop()
+    revocation.revoked.stop()
+    cache.stop()
+    task = getattr(app.state, "partition_maintenance", None)
+    if task:
+        task.cancel()
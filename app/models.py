@@ -1,8 +1,16 @@
-from sqlalchemy import Integer, String, DateTime, ForeignKey, Numeric, Enum, Text, Boolean, func
+from sqlalchemy import Integer, String, Date, DateTime, ForeignKey, Numeric, Enum, Text, Boolean, Index, func
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 import enum
+import os
 
-from database import Base
+from database import Base, engine
+
+# Particionamento mensal opcional de interactions por occurred_at (só PostgreSQL).
+# Vale apenas para tabelas novas: uma tabela comum existente precisa ser migrada à mão.
+INTERACTIONS_PARTITIONED = (
+    os.getenv("INTERACTIONS_PARTITIONING", "").lower() == "monthly"
+    and engine.dialect.name == "postgresql"
+)
 
 class OpportunityStage(str, enum.Enum):
     new = "new"
@@ -14,6 +22,10 @@ class OpportunityStage(str, enum.Enum):
 
 class Customer(Base):
     __tablename__ = "customers"
+    __table_args__ = (
+        # suporta a paginação por cursor de GET /customers (ORDER BY created_at DESC, id DESC)
+        Index("ix_customers_created_at_id", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     name: Mapped[str] = mapped_column(String(150), nullable=False, index=True)
@@ -23,26 +35,51 @@ class Customer(Base):
     created_at: Mapped["DateTime"] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
     interactions: Mapped[list["Interaction"]] = relationship(
-        "Interaction", back_populates="customer", cascade="all, delete-orphan"
+        "Interaction", back_populates="customer", cascade="all, delete-orphan", passive_deletes=True
     )
     opportunities: Mapped[list["Opportunity"]] = relationship(
-        "Opportunity", back_populates="customer", cascade="all, delete-orphan"
+        "Opportunity", back_populates="customer", cascade="all, delete-orphan", passive_deletes=True
     )
 
 
 class Interaction(Base):
     __tablename__ = "interactions"
+    # particionada, a chave primária precisa incluir occurred_at; para o ORM a identidade continua sendo id
+    __table_args__ = {"postgresql_partition_by": "RANGE (occurred_at)"} if INTERACTIONS_PARTITIONED else {}
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True, index=True)
     customer_id: Mapped[int] = mapped_column(
         ForeignKey("customers.id", ondelete="CASCADE"), index=True, nullable=False
     )
     type: Mapped[str] = mapped_column(String(50), nullable=False)  # call, meeting, email, whatsapp, etc.
     notes: Mapped[str | None] = mapped_column(Text, nullable=True)
-    occurred_at: Mapped["DateTime"] = mapped_column(DateTime(timezone=True), server_default=func.now(), index=True)
+    occurred_at: Mapped["DateTime"] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), index=True, primary_key=INTERACTIONS_PARTITIONED
+    )
 
     customer: Mapped["Customer"] = relationship("Customer", back_populates="interactions")
 
+    __mapper_args__ = {"primary_key": [id]}
+
+
+# Linha do tempo do cliente: WHERE customer_id = ? ORDER BY occurred_at DESC, id DESC
+Index(
+    "ix_interactions_customer_timeline",
+    Interaction.customer_id,
+    Interaction.occurred_at.desc(),
+    Interaction.id.desc(),
+)
+
+
+class InteractionDailyCount(Base):
+    """Interações por cliente/dia (UTC)/tipo, mantida por triggers (rollups.py)."""
+    __tablename__ = "interaction_daily_counts"
+
+    customer_id: Mapped[int] = mapped_column(ForeignKey("customers.id", ondelete="CASCADE"), primary_key=True)
+    day: Mapped["Date"] = mapped_column(Date, primary_key=True)
+    type: Mapped[str] = mapped_column(String(50), primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
 
 class Opportunity(Base):
     __tablename__ = "opportunities"
@@ -65,6 +102,43 @@ class Opportunity(Base):
     customer: Mapped["Customer"] = relationship("Customer", back_populates="opportunities")
 
 
+# GET /opportunities/pipeline sem o resumo: GROUP BY stage lido só do índice;
+# também atende stage + faixa de valor / ordenação por value dentro do estágio
+Index("ix_opportunities_stage_value", Opportunity.stage, Opportunity.value)
+# GET /opportunities: um índice (filtro de igualdade, coluna de ordenação, id) por combinação
+Index("ix_opportunities_created_at_id", Opportunity.created_at, Opportunity.id)
+Index("ix_opportunities_value_id", Opportunity.value, Opportunity.id)
+Index("ix_opportunities_close_date_id", Opportunity.close_date, Opportunity.id)
+Index("ix_opportunities_stage_created_at", Opportunity.stage, Opportunity.created_at, Opportunity.id)
+Index("ix_opportunities_stage_close_date", Opportunity.stage, Opportunity.close_date, Opportunity.id)
+Index("ix_opportunities_customer_created_at", Opportunity.customer_id, Opportunity.created_at, Opportunity.id)
+
+
+class OpportunityStageTotal(Base):
+    """Quantidade e soma de value por estágio, mantida por triggers (rollups.py) quando
+    OPPORTUNITY_PIPELINE_SUMMARY está ativo."""
+    __tablename__ = "opportunity_stage_totals"
+
+    stage: Mapped[OpportunityStage] = mapped_column(Enum(OpportunityStage, name="opportunity_stage"), primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    total_value: Mapped[float] = mapped_column(Numeric(16, 2), nullable=False, default=0)
+
+
+class OpportunityStageChange(Base):
+    """Histórico (só inserção) das mudanças de estágio, gravado por triggers (rollups.py).
+    Sem FK: o histórico continua valendo para as análises depois que a oportunidade é removida."""
+    __tablename__ = "opportunity_stage_history"
+    __table_args__ = (
+        Index("ix_stage_history_opportunity", "opportunity_id", "changed_at", "id"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    opportunity_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    from_stage: Mapped[OpportunityStage | None] = mapped_column(Enum(OpportunityStage, name="opportunity_stage"), nullable=True)
+    to_stage: Mapped[OpportunityStage] = mapped_column(Enum(OpportunityStage, name="opportunity_stage"), nullable=False)
+    changed_at: Mapped["DateTime"] = mapped_column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -72,3 +146,26 @@ class User(Base):
     email: Mapped[str] = mapped_column(String(150), unique=True, nullable=False, index=True)
     hashed_password: Mapped[str] = mapped_column(String, nullable=False)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)  # 🔹 usar Boolean explícito
+
+
+class ApiKey(Base):
+    """Chave de API de um usuário. Só o sha256 da chave é guardado; a chave aparece uma vez, na criação."""
+    __tablename__ = "api_keys"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    prefix: Mapped[str] = mapped_column(String(12), nullable=False)  # início da chave, para identificá-la
+    key_hash: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class RevokedToken(Base):
+    """jti de um token (acesso ou refresh) revogado antes de expirar. A linha pode ser
+    apagada depois de expires_at: o token já não seria aceito de qualquer forma."""
+    __tablename__ = "revoked_tokens"
+
+    jti: Mapped[str] = mapped_column(String(32), primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
+    expires_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), index=True, nullable=False)
+    revoked_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
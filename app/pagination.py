@@ -0,0 +1,68 @@
+# app/pagination.py
+import base64
+import binascii
+import enum
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Callable, Sequence
+
+from sqlalchemy import tuple_
+
+# Cabeçalho usado pelas listagens para devolver o cursor da próxima página
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+
+# ----- Cursor opaco -----
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *parsers: Callable[[Any], Any]) -> list:
+    """Decodifica um cursor gerado por encode_cursor aplicando um parser por posição.
+
+    Levanta ValueError se o cursor estiver malformado.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(parsers):
+            raise ValueError
+        return [parse(v) for parse, v in zip(parsers, values)]
+    except (ValueError, TypeError, binascii.Error):
+        raise ValueError("Cursor inválido")
+
+
+def parse_datetime(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def parse_decimal(value: str) -> Decimal:
+    try:
+        return Decimal(value)
+    except ArithmeticError:
+        raise ValueError(value)
+
+
+# ----- Keyset -----
+def keyset_after(columns: Sequence, values: Sequence, descending: bool = True):
+    """Predicado de seek: linhas que vêm depois de `values` na ordenação por `columns`."""
+    if descending:
+        return tuple_(*columns) < tuple_(*values)
+    return tuple_(*columns) > tuple_(*values)
+
+
+def split_page(rows: Sequence, limit: int):
+    """Recebe até limit + 1 linhas e devolve (página, há_mais)."""
+    return rows[:limit], len(rows) > limit
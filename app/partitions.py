@@ -0,0 +1,81 @@
+# app/partitions.py
+# Manutenção das partições mensais de interactions (INTERACTIONS_PARTITIONING=monthly).
+# - cria antecipadamente as partições dos próximos meses (e uma partição DEFAULT,
+#   que recebe datas fora das faixas criadas em vez de rejeitar o insert)
+# - opcionalmente desanexa (DETACH) partições mais antigas que a retenção; a tabela
+#   desanexada é mantida para arquivamento e pode ser removida manualmente
+import logging
+import os
+from datetime import date
+from typing import Optional
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+
+import models
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+MONTHS_AHEAD = int(os.getenv("INTERACTIONS_PARTITIONS_AHEAD", "3"))
+RETENTION_MONTHS = int(os.getenv("INTERACTIONS_RETENTION_MONTHS", "0")) or None  # 0/vazio = manter tudo
+MAINTENANCE_INTERVAL_SECONDS = 24 * 60 * 60
+
+PARENT = models.Interaction.__tablename__
+
+
+def _add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT}_p{month:%Y%m}"
+
+
+def _is_partitioned(conn) -> bool:
+    return conn.exec_driver_sql(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%(name)s)", {"name": PARENT}
+    ).first() is not None
+
+
+def _attached_partitions(conn) -> list[str]:
+    return list(conn.exec_driver_sql(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(%(name)s)", {"name": PARENT}
+    ).scalars())
+
+
+def maintain(
+    bind: Engine = engine,
+    today: Optional[date] = None,
+    months_ahead: int = MONTHS_AHEAD,
+    retention_months: Optional[int] = RETENTION_MONTHS,
+):
+    if not models.INTERACTIONS_PARTITIONED:
+        return
+    current = (today or date.today()).replace(day=1)
+    with bind.begin() as conn:
+        if not _is_partitioned(conn):
+            logger.warning("INTERACTIONS_PARTITIONING ativo, mas %s não é uma tabela particionada", PARENT)
+            return
+        conn.exec_driver_sql(f"CREATE TABLE IF NOT EXISTS {PARENT}_default PARTITION OF {PARENT} DEFAULT")
+        for offset in range(0, months_ahead + 1):
+            start = _add_months(current, offset)
+            try:
+                with conn.begin_nested():
+                    conn.exec_driver_sql(
+                        f"CREATE TABLE IF NOT EXISTS {partition_name(start)} PARTITION OF {PARENT} "
+                        f"FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') "
+                        f"TO ('{_add_months(start, 1).isoformat()} 00:00:00+00')"
+                    )
+            except DBAPIError:
+                # ex.: a partição DEFAULT já tem linhas desse mês; exige mover os dados à mão
+                logger.exception("Não foi possível criar a partição %s", partition_name(start))
+        if retention_months:
+            oldest_kept = partition_name(_add_months(current, -retention_months))
+            for name in _attached_partitions(conn):
+                # nomes interactions_pAAAAMM ordenam cronologicamente
+                if name.startswith(f"{PARENT}_p") and name < oldest_kept:
+                    conn.exec_driver_sql(f"ALTER TABLE {PARENT} DETACH PARTITION {name}")
+                    logger.info("Partição %s desanexada", name)
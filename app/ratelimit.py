@@ -0,0 +1,132 @@
+# app/ratelimit.py
+# Limite de tentativas de login (POST /token) por token bucket, por IP e por conta.
+#
+# Cada chave tem um balde com até `burst` fichas que se repõe a `per_minute` fichas por
+# minuto; cada tentativa gasta uma ficha, e sem ficha a resposta é 429 com Retry-After.
+# A verificação roda antes de qualquer consulta ao banco ou bcrypt. Toda tentativa
+# conta, inclusive as que acertam a senha: o resultado só é conhecido depois do bcrypt.
+#
+# Backends (LOGIN_RATE_LIMIT_BACKEND):
+# - memory (padrão): dicionário no processo; com N workers, o limite efetivo é N vezes maior
+# - sqlite: arquivo SQLite compartilhado pelos workers da mesma máquina
+#   (LOGIN_RATE_LIMIT_SQLITE_PATH); cada tentativa é um único UPSERT atômico
+# Outros backends (ex.: Redis) entram em BACKENDS com o mesmo método take().
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+ENABLED = os.getenv("LOGIN_RATE_LIMIT", "1").lower() not in ("0", "false", "off")
+BACKEND = os.getenv("LOGIN_RATE_LIMIT_BACKEND", "memory")
+SQLITE_PATH = os.getenv("LOGIN_RATE_LIMIT_SQLITE_PATH", "./ratelimit.db")
+MAX_KEYS = int(os.getenv("LOGIN_RATE_LIMIT_MAX_KEYS", "100000"))
+
+
+class Limit(NamedTuple):
+    burst: int
+    per_minute: float
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute / 60
+
+
+IP_LIMIT = Limit(int(os.getenv("LOGIN_IP_BURST", "30")), float(os.getenv("LOGIN_IP_PER_MINUTE", "30")))
+ACCOUNT_LIMIT = Limit(
+    int(os.getenv("LOGIN_ACCOUNT_BURST", "10")), float(os.getenv("LOGIN_ACCOUNT_PER_MINUTE", "5"))
+)
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("Muitas tentativas de login")
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+# ----- Backends: take() gasta uma ficha e devolve 0, ou os segundos até haver uma -----
+class MemoryBackend:
+    def __init__(self, max_keys: int = MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, limit: Limit) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return (1 - tokens) / limit.rate
+            self._buckets[key] = (tokens - 1, now)
+            self._buckets.move_to_end(key)
+            # descartar o balde mais antigo equivale a devolvê-lo cheio
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return 0
+
+
+class SQLiteBackend:
+    TAKE_SQL = """
+        INSERT INTO login_buckets (key, tokens, updated) VALUES (:key, :burst - 1, :now)
+        ON CONFLICT (key) DO UPDATE SET
+            tokens = MIN(:burst, tokens + (:now - updated) * :rate) - 1,
+            updated = :now
+        WHERE MIN(:burst, tokens + (:now - updated) * :rate) >= 1
+        RETURNING tokens
+    """
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS login_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, limit: Limit) -> float:
+        # relógio de parede: o arquivo é compartilhado entre processos
+        now = time.time()
+        params = {"key": key, "burst": limit.burst, "rate": limit.rate, "now": now}
+        conn = self._conn()
+        if conn.execute(self.TAKE_SQL, params).fetchone() is not None:
+            return 0
+        row = conn.execute("SELECT tokens, updated FROM login_buckets WHERE key = ?", (key,)).fetchone()
+        tokens = min(limit.burst, row[0] + (now - row[1]) * limit.rate) if row else limit.burst
+        return max(0.0, (1 - tokens) / limit.rate)
+
+
+BACKENDS = {"memory": MemoryBackend, "sqlite": SQLiteBackend}
+
+
+# ----- Login -----
+class LoginLimiter:
+    def __init__(self, backend, ip_limit: Limit = IP_LIMIT, account_limit: Limit = ACCOUNT_LIMIT):
+        self.backend = backend
+        self.ip_limit = ip_limit
+        self.account_limit = account_limit
+
+    def check(self, ip: Optional[str], account: str):
+        """Gasta uma ficha do IP e uma da conta; RateLimited se faltar alguma."""
+        # o IP primeiro: um IP bloqueado não consome as fichas da conta
+        wait = self.backend.take(f"ip:{ip or '-'}", self.ip_limit)
+        if not wait:
+            wait = self.backend.take(f"account:{account.strip().lower()}", self.account_limit)
+        if wait:
+            raise RateLimited(wait)
+
+
+if BACKEND not in BACKENDS:
+    raise ValueError(f"LOGIN_RATE_LIMIT_BACKEND desconhecido: {BACKEND}")
+login = LoginLimiter(BACKENDS[BACKEND]())
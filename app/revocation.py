@@ -0,0 +1,154 @@
+# app/revocation.py
+# Revogação de tokens (acesso e refresh) pelo jti, com um filtro de Bloom na frente.
+#
+# Revogar grava o jti em revoked_tokens (até o token expirar) e o adiciona ao filtro.
+# Na verificação, o filtro responde "com certeza não revogado" sem ir ao banco: é o
+# caso de quase toda requisição. Só um "talvez" (revogado de fato, ou um falso
+# positivo, ~TOKEN_REVOCATION_FP_RATE) consulta a tabela pela chave primária.
+#
+# O filtro é reconstruído do banco na subida e a cada TOKEN_REVOCATION_REFRESH_SECONDS,
+# numa thread: assim entram as revogações feitas por outros workers e saem as de
+# tokens já expirados (filtro de Bloom não remove itens). Com USER_CACHE_CHANNEL=postgres
+# a revogação também chega aos outros workers na hora, pelo canal de cache.py.
+import hashlib
+import logging
+import math
+import os
+import threading
+from datetime import datetime
+from typing import Callable, Optional
+
+from sqlalchemy.orm import Session
+
+import cache
+import crud
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+CAPACITY = int(os.getenv("TOKEN_REVOCATION_FILTER_CAPACITY", "100000"))
+FP_RATE = float(os.getenv("TOKEN_REVOCATION_FP_RATE", "0.001"))
+REFRESH_SECONDS = float(os.getenv("TOKEN_REVOCATION_REFRESH_SECONDS", "30"))
+
+MESSAGE_KIND = "revoked_token"
+
+
+class BloomFilter:
+    """Conjunto aproximado: "não está" é sempre certo; "está" erra com probabilidade
+    ~fp_rate enquanto houver até `capacity` itens."""
+
+    def __init__(self, capacity: int, fp_rate: float):
+        capacity = max(1, capacity)
+        self.size = max(64, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        # um blake2b dá os dois hashes de 64 bits; as k posições saem de h1 + i*h2
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationList:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        capacity: int = CAPACITY,
+        fp_rate: float = FP_RATE,
+        refresh_seconds: float = REFRESH_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.refresh_seconds = refresh_seconds
+        self._filter = BloomFilter(capacity, fp_rate)
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        # jti adicionados enquanto um reload lê o banco (o novo filtro também os recebe)
+        self._added_during_reload: Optional[set[str]] = None
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.reload()
+        if self.refresh_seconds > 0:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="token-revocation-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.refresh_seconds):
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("Falha ao recarregar os tokens revogados")
+
+    def reload(self):
+        """Reconstrói o filtro com as revogações ainda válidas do banco."""
+        with self._reload_lock:
+            with self._lock:
+                self._added_during_reload = set()
+            try:
+                db = self.session_factory()
+                try:
+                    crud.prune_revoked_tokens(db)
+                    jtis = crud.list_revoked_jtis(db)
+                finally:
+                    db.close()
+                new_filter = BloomFilter(max(self.capacity, 2 * len(jtis)), self.fp_rate)
+                for jti in jtis:
+                    new_filter.add(jti)
+                with self._lock:
+                    for jti in self._added_during_reload:
+                        new_filter.add(jti)
+                    self._filter = new_filter
+            finally:
+                with self._lock:
+                    self._added_during_reload = None
+
+    def add(self, jti: str):
+        with self._lock:
+            self._filter.add(jti)
+            if self._added_during_reload is not None:
+                self._added_during_reload.add(jti)
+
+    def is_revoked(self, db: Session, jti: str) -> bool:
+        if jti not in self._filter:
+            return False  # caminho comum: sem consulta ao banco
+        return crud.is_token_revoked(db, jti)
+
+    def revoke(self, db: Session, jti: str, user_id: int, expires_at: datetime) -> bool:
+        """Revoga o jti; False se já estava revogado."""
+        if not crud.revoke_token(db, jti, user_id, expires_at):
+            return False
+        cache.publish(MESSAGE_KIND, jti)  # chega a _on_message aqui e nos outros workers
+        return True
+
+    def _on_message(self, jti: Optional[str]):
+        if jti is None:
+            # o canal pode ter perdido revogações; se o banco falhar, fica para o próximo ciclo
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("Falha ao recarregar os tokens revogados")
+        else:
+            self.add(jti)
+
+
+revoked = RevocationList()
+cache.handlers[MESSAGE_KIND] = revoked._on_message
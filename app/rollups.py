@@ -0,0 +1,282 @@
+# app/rollups.py
+# Dados derivados mantidos incrementalmente pelo banco.
+# - interaction_daily_counts (cliente, dia UTC, tipo, quantidade): serve
+#   GET /customers/{id}/activity sem GROUP BY sobre interactions.
+# - opportunity_stage_totals (estágio, quantidade, soma de value), opcional
+#   (OPPORTUNITY_PIPELINE_SUMMARY=1): GET /opportunities/pipeline lê uma linha por
+#   estágio. Toda escrita em opportunities passa a atualizar a mesma linha do
+#   estágio, o que serializa escritas concorrentes; por isso é desligado por padrão.
+# - opportunity_stage_history: uma linha por criação/mudança de estágio, base do
+#   funil (analytics.py).
+# Os agregados são atualizados por triggers, e não em crud, para continuarem corretos
+# em todos os caminhos de escrita: buffer de escrita, DELETE em cascata, purge em lotes
+# e UPDATEs feitos direto no banco.
+# No PostgreSQL os triggers são por instrução (tabelas de transição): um INSERT de
+# 500 linhas gera um upsert por (cliente, dia, tipo), não 500.
+import os
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import Engine
+
+import models
+from database import engine
+
+PIPELINE_SUMMARY = os.getenv("OPPORTUNITY_PIPELINE_SUMMARY", "").lower() in ("1", "true", "on")
+
+DAILY_COUNTS = models.InteractionDailyCount.__tablename__
+STAGE_TOTALS = models.OpportunityStageTotal.__tablename__
+STAGE_HISTORY = models.OpportunityStageChange.__tablename__
+
+POSTGRES_DDL = [
+    f"""
+    CREATE OR REPLACE FUNCTION crm_interaction_counts_add() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO {DAILY_COUNTS} (customer_id, day, type, count)
+        SELECT customer_id, (occurred_at AT TIME ZONE 'UTC')::date, type, count(*)
+        FROM new_rows GROUP BY 1, 2, 3
+        ON CONFLICT (customer_id, day, type) DO UPDATE SET count = {DAILY_COUNTS}.count + EXCLUDED.count;
+        RETURN NULL;
+    END $$
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION crm_interaction_counts_remove() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        -- só UPDATE: numa remoção em cascata do cliente a linha do agregado pode já ter sido apagada
+        UPDATE {DAILY_COUNTS} c SET count = c.count - o.n
+        FROM (
+            SELECT customer_id, (occurred_at AT TIME ZONE 'UTC')::date AS day, type, count(*) AS n
+            FROM old_rows GROUP BY 1, 2, 3
+        ) o
+        WHERE c.customer_id = o.customer_id AND c.day = o.day AND c.type = o.type;
+        RETURN NULL;
+    END $$
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION crm_interaction_counts_move() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        -- considera só as linhas em que cliente, data ou tipo mudaram
+        UPDATE {DAILY_COUNTS} c SET count = c.count - o.n
+        FROM (
+            SELECT o.customer_id, (o.occurred_at AT TIME ZONE 'UTC')::date AS day, o.type, count(*) AS n
+            FROM old_rows o JOIN new_rows n ON n.id = o.id
+            WHERE (o.customer_id, o.occurred_at, o.type) IS DISTINCT FROM (n.customer_id, n.occurred_at, n.type)
+            GROUP BY 1, 2, 3
+        ) o
+        WHERE c.customer_id = o.customer_id AND c.day = o.day AND c.type = o.type;
+        INSERT INTO {DAILY_COUNTS} (customer_id, day, type, count)
+        SELECT n.customer_id, (n.occurred_at AT TIME ZONE 'UTC')::date, n.type, count(*)
+        FROM old_rows o JOIN new_rows n ON n.id = o.id
+        WHERE (o.customer_id, o.occurred_at, o.type) IS DISTINCT FROM (n.customer_id, n.occurred_at, n.type)
+        GROUP BY 1, 2, 3
+        ON CONFLICT (customer_id, day, type) DO UPDATE SET count = {DAILY_COUNTS}.count + EXCLUDED.count;
+        RETURN NULL;
+    END $$
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION crm_stage_history() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO {STAGE_HISTORY} (opportunity_id, from_stage, to_stage, changed_at)
+            SELECT id, NULL, stage, created_at FROM new_rows;
+        ELSE
+            INSERT INTO {STAGE_HISTORY} (opportunity_id, from_stage, to_stage, changed_at)
+            SELECT n.id, o.stage, n.stage, now()
+            FROM old_rows o JOIN new_rows n ON n.id = o.id
+            WHERE o.stage IS DISTINCT FROM n.stage;
+        END IF;
+        RETURN NULL;
+    END $$
+    """,
+    "DROP TRIGGER IF EXISTS opportunities_history_ai ON opportunities",
+    "DROP TRIGGER IF EXISTS opportunities_history_au ON opportunities",
+    """
+    CREATE TRIGGER opportunities_history_ai AFTER INSERT ON opportunities
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION crm_stage_history()
+    """,
+    """
+    CREATE TRIGGER opportunities_history_au AFTER UPDATE ON opportunities
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION crm_stage_history()
+    """,
+    "DROP TRIGGER IF EXISTS interactions_counts_ai ON interactions",
+    "DROP TRIGGER IF EXISTS interactions_counts_ad ON interactions",
+    "DROP TRIGGER IF EXISTS interactions_counts_au ON interactions",
+    """
+    CREATE TRIGGER interactions_counts_ai AFTER INSERT ON interactions
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION crm_interaction_counts_add()
+    """,
+    """
+    CREATE TRIGGER interactions_counts_ad AFTER DELETE ON interactions
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION crm_interaction_counts_remove()
+    """,
+    """
+    CREATE TRIGGER interactions_counts_au AFTER UPDATE ON interactions
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION crm_interaction_counts_move()
+    """,
+]
+
+SQLITE_DDL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS interactions_counts_ai AFTER INSERT ON interactions BEGIN
+        INSERT INTO {DAILY_COUNTS} (customer_id, day, type, count)
+        VALUES (new.customer_id, date(new.occurred_at), new.type, 1)
+        ON CONFLICT (customer_id, day, type) DO UPDATE SET count = count + 1;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS interactions_counts_ad AFTER DELETE ON interactions BEGIN
+        UPDATE {DAILY_COUNTS} SET count = count - 1
+        WHERE customer_id = old.customer_id AND day = date(old.occurred_at) AND type = old.type;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS interactions_counts_au
+    AFTER UPDATE OF customer_id, occurred_at, type ON interactions BEGIN
+        UPDATE {DAILY_COUNTS} SET count = count - 1
+        WHERE customer_id = old.customer_id AND day = date(old.occurred_at) AND type = old.type;
+        INSERT INTO {DAILY_COUNTS} (customer_id, day, type, count)
+        VALUES (new.customer_id, date(new.occurred_at), new.type, 1)
+        ON CONFLICT (customer_id, day, type) DO UPDATE SET count = count + 1;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS opportunities_history_ai AFTER INSERT ON opportunities BEGIN
+        INSERT INTO {STAGE_HISTORY} (opportunity_id, from_stage, to_stage, changed_at)
+        VALUES (new.id, NULL, new.stage, new.created_at);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS opportunities_history_au AFTER UPDATE OF stage ON opportunities
+    WHEN old.stage IS NOT new.stage BEGIN
+        INSERT INTO {STAGE_HISTORY} (opportunity_id, from_stage, to_stage, changed_at)
+        VALUES (new.id, old.stage, new.stage, strftime('%Y-%m-%d %H:%M:%f000', 'now'));
+    END
+    """,
+]
+
+# As linhas de todos os estágios são criadas no preenchimento, então os triggers só fazem UPDATE
+PIPELINE_POSTGRES_DDL = [
+    f"""
+    CREATE OR REPLACE FUNCTION crm_stage_totals() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            UPDATE {STAGE_TOTALS} t SET count = t.count - o.n, total_value = t.total_value - o.total
+            FROM (SELECT stage, count(*) AS n, coalesce(sum(value), 0) AS total FROM old_rows GROUP BY stage) o
+            WHERE t.stage = o.stage;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE {STAGE_TOTALS} t SET count = t.count + n.n, total_value = t.total_value + n.total
+            FROM (SELECT stage, count(*) AS n, coalesce(sum(value), 0) AS total FROM new_rows GROUP BY stage) n
+            WHERE t.stage = n.stage;
+        END IF;
+        RETURN NULL;
+    END $$
+    """,
+    """
+    CREATE TRIGGER opportunities_totals_ai AFTER INSERT ON opportunities
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION crm_stage_totals()
+    """,
+    """
+    CREATE TRIGGER opportunities_totals_ad AFTER DELETE ON opportunities
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION crm_stage_totals()
+    """,
+    """
+    CREATE TRIGGER opportunities_totals_au AFTER UPDATE ON opportunities
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION crm_stage_totals()
+    """,
+]
+
+PIPELINE_SQLITE_DDL = [
+    f"""
+    CREATE TRIGGER opportunities_totals_ai AFTER INSERT ON opportunities BEGIN
+        UPDATE {STAGE_TOTALS} SET count = count + 1, total_value = total_value + coalesce(new.value, 0)
+        WHERE stage = new.stage;
+    END
+    """,
+    f"""
+    CREATE TRIGGER opportunities_totals_ad AFTER DELETE ON opportunities BEGIN
+        UPDATE {STAGE_TOTALS} SET count = count - 1, total_value = total_value - coalesce(old.value, 0)
+        WHERE stage = old.stage;
+    END
+    """,
+    f"""
+    CREATE TRIGGER opportunities_totals_au AFTER UPDATE OF stage, value ON opportunities BEGIN
+        UPDATE {STAGE_TOTALS} SET count = count - 1, total_value = total_value - coalesce(old.value, 0)
+        WHERE stage = old.stage;
+        UPDATE {STAGE_TOTALS} SET count = count + 1, total_value = total_value + coalesce(new.value, 0)
+        WHERE stage = new.stage;
+    END
+    """,
+]
+
+PIPELINE_TRIGGERS = ("opportunities_totals_ai", "opportunities_totals_ad", "opportunities_totals_au")
+
+# Oportunidades anteriores ao histórico entram com o estágio atual na data de criação
+HISTORY_BACKFILL = f"""
+INSERT INTO {STAGE_HISTORY} (opportunity_id, from_stage, to_stage, changed_at)
+SELECT id, NULL, stage, created_at FROM opportunities
+"""
+
+BACKFILL = {
+    "postgresql": f"""
+    INSERT INTO {DAILY_COUNTS} (customer_id, day, type, count)
+    SELECT customer_id, (occurred_at AT TIME ZONE 'UTC')::date, type, count(*)
+    FROM interactions GROUP BY 1, 2, 3
+    """,
+    "sqlite": f"""
+    INSERT INTO {DAILY_COUNTS} (customer_id, day, type, count)
+    SELECT customer_id, date(occurred_at), type, count(*)
+    FROM interactions GROUP BY 1, 2, 3
+    """,
+}
+
+
+def install(bind: Engine = engine):
+    """Cria os triggers e preenche os agregados a partir dos dados existentes
+    (interaction_daily_counts e opportunity_stage_history só quando vazios;
+    opportunity_stage_totals sempre).
+
+    Tudo numa transação: no PostgreSQL o CREATE TRIGGER bloqueia escritas na tabela
+    até o commit, então nenhuma linha fica fora do preenchimento inicial.
+    """
+    ddl = {"postgresql": POSTGRES_DDL, "sqlite": SQLITE_DDL}.get(bind.dialect.name)
+    if ddl is None:
+        return
+    with bind.begin() as conn:
+        for statement in ddl:
+            conn.exec_driver_sql(statement)
+        if conn.exec_driver_sql(f"SELECT 1 FROM {DAILY_COUNTS} LIMIT 1").first() is None:
+            conn.exec_driver_sql(BACKFILL[bind.dialect.name])
+        if conn.exec_driver_sql(f"SELECT 1 FROM {STAGE_HISTORY} LIMIT 1").first() is None:
+            conn.exec_driver_sql(HISTORY_BACKFILL)
+        _install_pipeline(conn, bind.dialect.name)
+
+
+def _install_pipeline(conn, dialect: str):
+    for trigger in PIPELINE_TRIGGERS:
+        conn.exec_driver_sql(
+            f"DROP TRIGGER IF EXISTS {trigger} ON opportunities" if dialect == "postgresql"
+            else f"DROP TRIGGER IF EXISTS {trigger}"
+        )
+    if not PIPELINE_SUMMARY:
+        # desligado, as escritas não pagam pelos triggers; ao religar o resumo é recalculado
+        return
+    for statement in PIPELINE_POSTGRES_DDL if dialect == "postgresql" else PIPELINE_SQLITE_DDL:
+        conn.exec_driver_sql(statement)
+    # recalculado a cada inicialização: corrige qualquer divergência do período desligado
+    opportunities = models.Opportunity.__table__
+    totals = models.OpportunityStageTotal.__table__
+    current = {
+        stage: (count, total)
+        for stage, count, total in conn.execute(
+            select(opportunities.c.stage, func.count(), func.coalesce(func.sum(opportunities.c.value), 0))
+            .group_by(opportunities.c.stage)
+        )
+    }
+    conn.execute(totals.delete())
+    conn.execute(totals.insert(), [
+        {"stage": stage, "count": current.get(stage, (0, 0))[0], "total_value": current.get(stage, (0, 0))[1]}
+        for stage in models.OpportunityStage
+    ])
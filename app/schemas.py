@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr, Field
-from datetime import datetime, date
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field, field_validator
+from datetime import datetime, date, timezone
+from typing import Dict, List, Optional
 from models import OpportunityStage
 
 # ----- Customers -----
@@ -26,6 +26,18 @@ class CustomerOut(CustomerBase):
     class Config:
         from_attributes = True
 
+class BulkRowError(BaseModel):
+    row: int
+    email: Optional[str] = None
+    errors: List[str]
+
+class BulkImportResult(BaseModel):
+    received: int
+    inserted: int
+    failed: int
+    errors: List[BulkRowError]
+    errors_truncated: bool = False
+
 # ----- Interactions -----
 class InteractionBase(BaseModel):
     type: str
@@ -33,7 +45,14 @@ class InteractionBase(BaseModel):
     occurred_at: Optional[datetime] = None
 
 class InteractionCreate(InteractionBase):
-    pass
+    # convertido para UTC: o SQLite grava sem o fuso, e o dia em UTC dos totais diários
+    # (date(occurred_at) nos triggers de rollups.py) depende disso. Sem fuso = UTC
+    @field_validator("occurred_at")
+    @classmethod
+    def _occurred_at_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        if value is None:
+            return None
+        return value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
 
 class InteractionOut(InteractionBase):
     id: int
@@ -42,6 +61,15 @@ class InteractionOut(InteractionBase):
     class Config:
         from_attributes = True
 
+class ActivityBucket(BaseModel):
+    start: date  # primeiro dia do período (segunda-feira para semanas)
+    total: int
+    by_type: Dict[str, int]
+
+class InteractionSearchHit(InteractionOut):
+    score: float  # maior = mais relevante
+    snippet: Optional[str] = None  # trecho das notas com os termos entre <mark></mark>
+
 # ----- Opportunities -----
 class OpportunityBase(BaseModel):
     title: str
@@ -66,6 +94,57 @@ class OpportunityOut(OpportunityBase):
     class Config:
         from_attributes = True
 
+class OpportunityFilter(BaseModel):
+    stage: Optional[List[OpportunityStage]] = None
+    customer_id: Optional[int] = None
+    value_min: Optional[float] = None
+    value_max: Optional[float] = None
+    close_from: Optional[datetime] = None  # inclusive
+    close_to: Optional[datetime] = None  # exclusivo
+
+class OpportunityBulkUpdate(BaseModel):
+    ids: Optional[List[int]] = None
+    filter: Optional[OpportunityFilter] = None  # use ids ou filter, não os dois
+    changes: OpportunityUpdate
+
+class OpportunityBulkResult(BaseModel):
+    updated: int
+    missing_ids: List[int]  # ids pedidos que não existem
+
+class FunnelStage(BaseModel):
+    stage: OpportunityStage
+    entered: int  # entradas no estágio dentro da janela
+    advanced: Optional[int] = None  # das entradas, quantas avançaram no funil depois
+    lost: int  # das entradas, quantas foram perdidas depois
+    conversion_rate: Optional[float] = None
+    value: float  # soma do value atual das oportunidades que entraram
+    median_seconds_in_stage: Optional[float] = None
+    median_seconds_to_reach: Optional[float] = None
+
+class FunnelVelocity(BaseModel):
+    won: int
+    won_value: float
+    won_per_day: float
+    won_value_per_day: float
+    median_days_to_win: Optional[float] = None
+
+class Funnel(BaseModel):
+    date_from: datetime
+    date_to: datetime
+    stages: List[FunnelStage]
+    velocity: FunnelVelocity
+
+class PipelineStage(BaseModel):
+    stage: OpportunityStage
+    count: int
+    total_value: float
+
+class BoardColumn(BaseModel):
+    stage: OpportunityStage
+    count: int  # oportunidades do estágio que atendem aos filtros
+    items: List[OpportunityOut]
+    next_cursor: Optional[str] = None  # para GET /opportunities com o mesmo estágio e ordenação
+
 # ----- Users -----
 class UserBase(BaseModel):
     email: EmailStr
@@ -87,3 +166,35 @@ class UserOut(BaseModel):
 
     class Config:
         from_attributes = True
+
+class Token(BaseModel):
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+    expires_in: int  # segundos de validade do access_token
+
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
+class TokenRevoke(BaseModel):
+    token: str  # access ou refresh token
+
+class ApiKeyCreate(BaseModel):
+    name: str = Field(min_length=1, max_length=100)
+
+class ApiKeyOut(BaseModel):
+    id: int
+    name: str
+    prefix: str
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class ApiKeyCreated(ApiKeyOut):
+    key: str  # só aparece nesta resposta
+
+# ----- Visão geral do cliente -----
+class CustomerOverview(CustomerOut):
+    interactions: List[InteractionOut]
+    open_opportunities: List[OpportunityOut]
@@ -0,0 +1,364 @@
+# app/search.py
+# Buscas apoiadas em índice:
+# - clientes: no PostgreSQL pg_trgm + unaccent, índice GIN de trigramas sobre
+#   nome/email/empresa; no SQLite tabelas FTS5 (external content) mantidas por triggers,
+#   uma por palavras e outra por trigramas (trechos no meio das palavras).
+#   O ranking é email exato > nome começando pelo termo > demais ocorrências.
+# - notas das interações: no PostgreSQL tsvector com índice GIN; no SQLite FTS5.
+#   Resultados ordenados por relevância, com trecho destacado e paginação por cursor.
+# Em todos os casos a busca ignora acentos ("Joao" encontra "João").
+import re
+import sqlite3
+import unicodedata
+from datetime import datetime
+from typing import Optional, Sequence, Tuple
+
+from sqlalchemy import Float, String, cast, column, func, literal, literal_column, select, table
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+import models
+from database import engine
+from pagination import decode_cursor, encode_cursor, keyset_after, split_page
+
+# Termo com cara de email completo: "nome@dominio.tld"
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+# Marcadores do trecho (snippet) devolvido pela busca de interações
+SNIPPET_START, SNIPPET_STOP = "<mark>", "</mark>"
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    # unaccent() não é IMMUTABLE, então não pode ser usado direto num índice
+    """
+    CREATE OR REPLACE FUNCTION crm_unaccent(text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION crm_customer_search(text, text, text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$ SELECT crm_unaccent(lower(coalesce($1, '') || ' ' || coalesce($2, '') || ' ' || coalesce($3, ''))) $$
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_customers_search_trgm ON customers
+    USING gin (crm_customer_search(name, email, company) gin_trgm_ops)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_customers_name_unaccent ON customers
+    (crm_unaccent(lower(name)) text_pattern_ops, id)
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_customers_email_lower ON customers (lower(email))",
+    # configuração "simple" (sem stemming, como o unicode61 do SQLite) que remove acentos
+    """
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'crm_simple_unaccent') THEN
+            CREATE TEXT SEARCH CONFIGURATION crm_simple_unaccent (COPY = simple);
+            ALTER TEXT SEARCH CONFIGURATION crm_simple_unaccent
+                ALTER MAPPING FOR hword, hword_part, word WITH public.unaccent, simple;
+        END IF;
+    END $$
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_interactions_notes_fts ON interactions
+    USING gin (to_tsvector('crm_simple_unaccent'::regconfig, coalesce(notes, '')))
+    """,
+]
+
+# Tokenizador trigram (busca por trecho) a partir do SQLite 3.34; remove_diacritics
+# nele só a partir do 3.45. Antes disso, acentos contam na busca por trecho (as
+# camadas por palavra continuam ignorando acentos)
+SQLITE_TRIGRAM = sqlite3.sqlite_version_info >= (3, 34)
+SQLITE_TRIGRAM_TOKENIZE = "trigram remove_diacritics 1" if sqlite3.sqlite_version_info >= (3, 45) else "trigram"
+# trigramas exigem 3 caracteres; termos menores caem num LIKE sobre customers
+SQLITE_TRIGRAM_MIN = 3
+
+SQLITE_FTS_TABLES = {
+    "customers_fts": """
+    CREATE VIRTUAL TABLE customers_fts USING fts5(
+        name, email, company,
+        content='customers', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    "customers_trgm": f"""
+    CREATE VIRTUAL TABLE customers_trgm USING fts5(
+        name, email, company,
+        content='customers', content_rowid='id',
+        tokenize='{SQLITE_TRIGRAM_TOKENIZE}'
+    )
+    """,
+    "interactions_fts": """
+    CREATE VIRTUAL TABLE interactions_fts USING fts5(
+        notes,
+        content='interactions', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+}
+
+SQLITE_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_customers_email_lower ON customers (lower(email))",
+    """
+    CREATE TRIGGER IF NOT EXISTS customers_fts_ai AFTER INSERT ON customers BEGIN
+        INSERT INTO customers_fts(rowid, name, email, company)
+        VALUES (new.id, new.name, new.email, new.company);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS customers_fts_ad AFTER DELETE ON customers BEGIN
+        INSERT INTO customers_fts(customers_fts, rowid, name, email, company)
+        VALUES ('delete', old.id, old.name, old.email, old.company);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS customers_fts_au AFTER UPDATE ON customers BEGIN
+        INSERT INTO customers_fts(customers_fts, rowid, name, email, company)
+        VALUES ('delete', old.id, old.name, old.email, old.company);
+        INSERT INTO customers_fts(rowid, name, email, company)
+        VALUES (new.id, new.name, new.email, new.company);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS customers_trgm_ai AFTER INSERT ON customers BEGIN
+        INSERT INTO customers_trgm(rowid, name, email, company)
+        VALUES (new.id, new.name, new.email, new.company);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS customers_trgm_ad AFTER DELETE ON customers BEGIN
+        INSERT INTO customers_trgm(customers_trgm, rowid, name, email, company)
+        VALUES ('delete', old.id, old.name, old.email, old.company);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS customers_trgm_au AFTER UPDATE ON customers BEGIN
+        INSERT INTO customers_trgm(customers_trgm, rowid, name, email, company)
+        VALUES ('delete', old.id, old.name, old.email, old.company);
+        INSERT INTO customers_trgm(rowid, name, email, company)
+        VALUES (new.id, new.name, new.email, new.company);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS interactions_fts_ai AFTER INSERT ON interactions BEGIN
+        INSERT INTO interactions_fts(rowid, notes) VALUES (new.id, new.notes);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS interactions_fts_ad AFTER DELETE ON interactions BEGIN
+        INSERT INTO interactions_fts(interactions_fts, rowid, notes) VALUES ('delete', old.id, old.notes);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS interactions_fts_au AFTER UPDATE OF notes ON interactions BEGIN
+        INSERT INTO interactions_fts(interactions_fts, rowid, notes) VALUES ('delete', old.id, old.notes);
+        INSERT INTO interactions_fts(rowid, notes) VALUES (new.id, new.notes);
+    END
+    """,
+]
+
+
+# ----- Normalização -----
+def normalize(value: Optional[str]) -> Optional[str]:
+    """Minúsculas e sem acentos: "João" -> "joao"."""
+    if value is None:
+        return None
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower().strip()
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# ----- Instalação -----
+def install(bind: Engine = engine):
+    with bind.begin() as conn:
+        if bind.dialect.name == "postgresql":
+            for ddl in POSTGRES_DDL:
+                conn.exec_driver_sql(ddl)
+        elif bind.dialect.name == "sqlite":
+            for name, ddl in SQLITE_FTS_TABLES.items():
+                if name == "customers_trgm" and not SQLITE_TRIGRAM:
+                    continue
+                exists = conn.exec_driver_sql(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+                ).first()
+                if not exists:
+                    conn.exec_driver_sql(ddl)
+                    conn.exec_driver_sql(f"INSERT INTO {name}({name}) VALUES ('rebuild')")
+            for ddl in SQLITE_DDL:
+                if "customers_trgm" in ddl and not SQLITE_TRIGRAM:
+                    continue
+                conn.exec_driver_sql(ddl)
+
+
+# ----- Busca de clientes -----
+# A relevância é resolvida em camadas, cada uma uma consulta com LIMIT apoiada
+# em índice, em vez de um ORDER BY sobre todas as ocorrências:
+#   1. email exato            (índice em lower(email))
+#   2. nome começando pelo termo
+#   3. termo em qualquer parte de nome/email/empresa (no SQLite: primeiro palavras
+#      começando pelo termo, depois trechos no meio das palavras, por trigramas)
+def search_customers(db: Session, q: str, limit: int = 50, offset: int = 0) -> Sequence[models.Customer]:
+    term = normalize(q)
+    if not term or not re.search(r"\w", term):
+        return []
+    if EMAIL_RE.match(term):
+        # email completo encontrado: as camadas aproximadas só acrescentariam ruído (e
+        # custo: no FTS, "example"* e "com"* casam com quase todos os clientes)
+        customer = db.scalars(_exact_email(term)(1).limit(1)).first()
+        if customer is not None:
+            return [customer][offset:offset + limit]
+    if db.get_bind().dialect.name == "sqlite":
+        tiers = _sqlite_tiers(term)
+    else:
+        tiers = _postgres_tiers(term)
+
+    wanted = limit + offset
+    found: list[models.Customer] = []
+    seen: set[int] = set()
+    for tier in tiers:
+        missing = wanted - len(found)
+        if missing <= 0:
+            break
+        stmt = tier(missing + len(seen))
+        if seen:
+            stmt = stmt.where(models.Customer.id.not_in(seen))
+        for customer in db.scalars(stmt.limit(missing)):
+            seen.add(customer.id)
+            found.append(customer)
+    return found[offset:wanted]
+
+
+def _exact_email(term: str):
+    return lambda k: select(models.Customer).where(func.lower(models.Customer.email) == term)
+
+
+def _postgres_tiers(term: str):
+    name = func.crm_unaccent(func.lower(models.Customer.name))
+    document = func.crm_customer_search(models.Customer.name, models.Customer.email, models.Customer.company)
+    # LIKE '%termo%' e o operador <% (similaridade por palavra) usam o índice GIN de trigramas
+    contains = document.like("%" + _escape_like(term) + "%", escape="\\") | literal(term, String).op("<%")(document)
+    return [
+        _exact_email(term),
+        lambda k: select(models.Customer).where(
+            name.like(_escape_like(term) + "%", escape="\\")
+        ).order_by(models.Customer.id.desc()),
+        lambda k: select(models.Customer).where(contains).order_by(
+            func.word_similarity(term, document).desc(), models.Customer.id.desc()
+        ),
+    ]
+
+
+def _sqlite_tiers(term: str):
+    tokens = re.findall(r"\w+", term)
+    if EMAIL_RE.match(term):
+        # email sem correspondência exata: a sequência inteira no campo email
+        # ("joao example com"), não cada parte como prefixo em qualquer campo
+        return [_exact_email(term), lambda k: _sqlite_match('email : "' + " ".join(tokens) + '"', k)]
+    phrase = '"' + " ".join(tokens) + '"*'
+    # cada palavra vira um prefixo: "joao sil" -> "joao"* "sil"*
+    anywhere = " ".join(f'"{token}"*' for token in tokens)
+    return [
+        _exact_email(term),
+        lambda k: _sqlite_match(f"name : ^ {phrase}", k),
+        lambda k: _sqlite_match(anywhere, k),
+        lambda k: _sqlite_contains(tokens, k),
+    ]
+
+
+def _sqlite_match(match: str, k: int, fts: str = "customers_fts"):
+    # o LIMIT fica na consulta FTS, que percorre o índice em ordem de rowid decrescente
+    fts_table = table(fts, column("rowid"))
+    matched = select(fts_table.c.rowid).where(
+        literal_column(fts).op("MATCH")(match)
+    ).order_by(fts_table.c.rowid.desc()).limit(k)
+    return select(models.Customer).where(models.Customer.id.in_(matched)).order_by(models.Customer.id.desc())
+
+
+def _sqlite_contains(tokens: list[str], k: int):
+    """Cada palavra como trecho em qualquer campo: "ilva" encontra "DaSilva"."""
+    if SQLITE_TRIGRAM and all(len(token) >= SQLITE_TRIGRAM_MIN for token in tokens):
+        return _sqlite_match(" ".join(f'"{token}"' for token in tokens), k, fts="customers_trgm")
+    # termo curto (ou SQLite sem trigram): LIKE percorrendo customers do id mais novo
+    # para o mais antigo; para no k-ésimo resultado, mas sem resultados lê a tabela toda
+    document = func.lower(
+        func.coalesce(models.Customer.name, "") + " " + func.coalesce(models.Customer.email, "")
+        + " " + func.coalesce(models.Customer.company, "")
+    )
+    conditions = [document.like("%" + _escape_like(token) + "%", escape="\\") for token in tokens]
+    return select(models.Customer).where(*conditions).order_by(models.Customer.id.desc())
+
+
+# ----- Busca nas notas das interações -----
+def search_interactions(
+    db: Session,
+    q: str,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    customer_id: Optional[int] = None,
+    type: Optional[str] = None,
+    occurred_from: Optional[datetime] = None,
+    occurred_to: Optional[datetime] = None,
+) -> Tuple[list[Tuple[models.Interaction, float, Optional[str]]], Optional[str]]:
+    """Devolve ([(interação, score, trecho)], próximo cursor); maior score = mais relevante."""
+    tokens = re.findall(r"\w+", normalize(q) or "")
+    if not tokens:
+        return [], None
+    if db.get_bind().dialect.name == "sqlite":
+        stmt, score = _sqlite_notes_search(tokens)
+    else:
+        stmt, score = _postgres_notes_search(tokens)
+
+    Interaction = models.Interaction
+    if customer_id is not None:
+        stmt = stmt.where(Interaction.customer_id == customer_id)
+    if type:
+        stmt = stmt.where(Interaction.type == type)
+    if occurred_from:
+        stmt = stmt.where(Interaction.occurred_at >= occurred_from)
+    if occurred_to:
+        stmt = stmt.where(Interaction.occurred_at < occurred_to)
+    if cursor:
+        last_score, last_id = decode_cursor(cursor, float, int)
+        stmt = stmt.where(keyset_after((score, Interaction.id), (last_score, last_id)))
+    stmt = stmt.order_by(score.desc(), Interaction.id.desc()).limit(limit + 1)
+
+    hits, has_more = split_page([tuple(row) for row in db.execute(stmt)], limit)
+    next_cursor = None
+    if has_more:
+        interaction, last_score, _ = hits[-1]
+        next_cursor = encode_cursor(last_score, interaction.id)
+    return hits, next_cursor
+
+
+def _postgres_notes_search(tokens: list[str]):
+    config = literal_column("'crm_simple_unaccent'::regconfig")
+    # mesma expressão do índice ix_interactions_notes_fts
+    document = func.to_tsvector(config, func.coalesce(models.Interaction.notes, literal_column("''")))
+    # cada palavra vira um prefixo: "joao sil" -> joao:* & sil:*
+    query = func.to_tsquery(config, " & ".join(f"{token}:*" for token in tokens))
+    # ts_rank_cd devolve real (float4), mas o score do cursor volta como float8, e
+    # (float8) 0.1::real > 0.1: os empates com o último score da página seriam pulados.
+    # Em double precision o cursor é exato no SELECT, no ORDER BY e no keyset
+    score = cast(func.ts_rank_cd(document, query), Float(precision=53))
+    snippet = func.ts_headline(
+        config, models.Interaction.notes, query,
+        f"StartSel={SNIPPET_START}, StopSel={SNIPPET_STOP}, MaxWords=25, MinWords=10, MaxFragments=2",
+    )
+    stmt = select(models.Interaction, score.label("score"), snippet.label("snippet")).where(document.op("@@")(query))
+    return stmt, score
+
+
+def _sqlite_notes_search(tokens: list[str]):
+    fts = literal_column("interactions_fts")
+    fts_table = table("interactions_fts", column("rowid"))
+    # bm25() é menor para os mais relevantes; negado, vale "maior = melhor" como no PostgreSQL
+    score = -func.bm25(fts)
+    snippet = func.snippet(fts, 0, SNIPPET_START, SNIPPET_STOP, "…", 24)
+    stmt = select(models.Interaction, score.label("score"), snippet.label("snippet")).select_from(fts_table).join(
+        models.Interaction, models.Interaction.id == fts_table.c.rowid
+    ).where(fts.op("MATCH")(" ".join(f'"{token}"*' for token in tokens)))
+    return stmt, score
@@ -0,0 +1,131 @@
+# app/writebuffer.py
+# Buffer de escrita (group commit) para POST /customers/{id}/interactions.
+#
+# Ativado com INTERACTION_WRITE_BUFFER=1. As interações validadas entram numa fila em
+# memória; uma thread grava a fila a cada INTERACTION_BUFFER_FLUSH_MS ou quando
+# INTERACTION_BUFFER_MAX_ROWS linhas se acumulam, com um INSERT de várias linhas e um
+# único commit para o lote inteiro.
+#
+# Semântica da confirmação:
+# - padrão (202 Accepted): a interação foi validada e está NA MEMÓRIA do processo. Ela
+#   é gravada em até FLUSH_MS, mas se perde se o processo morrer antes disso (crash,
+#   kill -9, OOM). Um desligamento normal grava o que estiver pendente. Interações de
+#   clientes inexistentes são descartadas na gravação (e registradas no log).
+# - ?wait=true (201 Created): a resposta só sai depois do commit do lote que contém a
+#   interação, então a confirmação é durável; várias requisições concorrentes
+#   compartilham o mesmo commit.
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from sqlalchemy.orm import Session
+
+import crud
+import schemas
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("INTERACTION_WRITE_BUFFER", "").lower() in ("1", "true", "on")
+FLUSH_MS = int(os.getenv("INTERACTION_BUFFER_FLUSH_MS", "50"))
+MAX_ROWS = int(os.getenv("INTERACTION_BUFFER_MAX_ROWS", "500"))
+MAX_PENDING = int(os.getenv("INTERACTION_BUFFER_MAX_PENDING", "50000"))
+
+
+class BufferFull(Exception):
+    pass
+
+
+class InteractionWriteBuffer:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        flush_ms: int = FLUSH_MS,
+        max_rows: int = MAX_ROWS,
+        max_pending: int = MAX_PENDING,
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_ms / 1000
+        self.max_rows = max_rows
+        self.max_pending = max_pending
+        self._pending: list[tuple[dict, Future]] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._flush_now = False
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="interaction-write-buffer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Grava o que estiver pendente e encerra a thread."""
+        if not self._thread:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, customer_id: int, data: schemas.InteractionCreate, flush_now: bool = False) -> Future:
+        """Enfileira a interação; flush_now acorda a gravação sem esperar o intervalo
+        (quem espera o commit não paga FLUSH_MS; as linhas que chegam durante um commit
+        formam o próximo lote)."""
+        row = {"customer_id": customer_id, **data.model_dump()}
+        # o horário é o da aceitação, não o da gravação do lote
+        row["occurred_at"] = row["occurred_at"] or datetime.now(timezone.utc)
+        future: Future = Future()
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                raise BufferFull("Fila de gravação cheia")
+            self._pending.append((row, future))
+            self._flush_now = self._flush_now or flush_now
+            if self._flush_now or len(self._pending) >= self.max_rows:
+                self._cond.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not (self._stopping or self._flush_now) and len(self._pending) < self.max_rows:
+                    self._cond.wait(self.flush_interval)
+                batch = self._pending[:self.max_rows]
+                del self._pending[:self.max_rows]
+                self._flush_now = self._flush_now and bool(self._pending)
+                if not batch and self._stopping:
+                    return
+            if batch:
+                self._flush(batch)
+
+    def _flush(self, batch: list[tuple[dict, Future]]):
+        db = self.session_factory()
+        try:
+            created = crud.create_interactions(db, [row for row, _ in batch])
+        except Exception as e:
+            logger.exception("Falha ao gravar lote de %d interações", len(batch))
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            db.close()
+        dropped = 0
+        for (row, future), interaction in zip(batch, created):
+            if interaction is None:
+                dropped += 1
+                future.set_exception(LookupError("Cliente não encontrado"))
+            else:
+                future.set_result(interaction)
+        if dropped:
+            logger.warning("%d interações descartadas: cliente inexistente", dropped)
+
+
+buffer = InteractionWriteBuffer()
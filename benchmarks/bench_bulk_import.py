@@ -0,0 +1,65 @@
+# benchmarks/bench_bulk_import.py
+# Mede a vazão da importação em massa (POST /customers/bulk) sem o overhead HTTP.
+#
+# Uso (a partir da raiz do repositório):
+#   DATABASE_URL=sqlite:///./bench.db python benchmarks/bench_bulk_import.py 200000
+#
+# ATENÇÃO: os clientes gerados são gravados no banco apontado por DATABASE_URL.
+import csv
+import io
+import json
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "app"))
+os.environ.setdefault("DATABASE_URL", "sqlite:///./bench.db")
+
+import bulk  # noqa: E402
+import search  # noqa: E402
+from database import SessionLocal, engine, init_db  # noqa: E402
+
+CHUNK_BYTES = 64 * 1024
+
+
+def make_rows(total: int):
+    run = uuid.uuid4().hex[:8]  # permite rodar várias vezes no mesmo banco
+    for i in range(total):
+        yield {"name": f"Cliente {i}", "email": f"cliente{i}.{run}@empresa{i % 50}.com.br",
+               "phone": "11999990000", "company": f"Empresa {i % 50}"}
+
+
+def as_ndjson(rows) -> bytes:
+    return "".join(json.dumps(row) + "\n" for row in rows).encode()
+
+
+def as_csv(rows) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=["name", "email", "phone", "company"])
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def run(fmt: str, body: bytes, total: int):
+    chunks = (body[i:i + CHUNK_BYTES] for i in range(0, len(body), CHUNK_BYTES))
+    db = SessionLocal()
+    try:
+        t0 = time.perf_counter()
+        report = bulk.import_customers(db, chunks, fmt)
+        elapsed = time.perf_counter() - t0
+    finally:
+        db.close()
+    print(f"{fmt:<7}{total:>9} linhas{elapsed:>8.2f}s{total / elapsed:>10.0f} linhas/s"
+          f"  (inseridas={report['inserted']}, falhas={report['failed']})")
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    print(f"Banco: {engine.url.render_as_string(hide_password=True)}")
+    init_db()
+    search.install(engine)
+    run("ndjson", as_ndjson(make_rows(total)), total)
+    run("csv", as_csv(make_rows(total)), total)
@@ -0,0 +1,100 @@
+# benchmarks/load_auth.py
+# Teste de carga: uma rajada de logins (POST /token, bcrypt) não deve atrasar o CRUD.
+#
+# Mede a latência de GET /customers/{id} sozinho e depois durante a rajada, e conta as
+# respostas dos logins (200 ou 503 quando o pool de hashing.py está saturado).
+#
+# Uso (com a API rodando; sem o limite de logins, que barraria a rajada numa conta só):
+#   LOGIN_RATE_LIMIT=0 uvicorn main:app --app-dir app --port 8000
+#   python benchmarks/load_auth.py --url http://127.0.0.1:8000 --logins 200 --seconds 15
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+EMAIL = "carga@example.com"
+PASSWORD = "senha-de-carga"
+TIMEOUT = 30
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else float("nan")
+
+
+async def setup(client: httpx.AsyncClient) -> int:
+    r = await client.post("/users", json={"email": EMAIL, "password": PASSWORD})
+    if r.status_code not in (201, 400):  # 400: já existe
+        r.raise_for_status()
+    r = await client.post("/customers", json={"name": "Cliente da carga"})
+    r.raise_for_status()
+    return r.json()["id"]
+
+
+async def probe(client: httpx.AsyncClient, customer_id: int, until: float, latencies: list[float]):
+    while time.perf_counter() < until:
+        t0 = time.perf_counter()
+        try:
+            r = await client.get(f"/customers/{customer_id}")
+            r.raise_for_status()
+        except httpx.TimeoutException:
+            pass  # entra na conta com o tempo até o timeout
+        latencies.append((time.perf_counter() - t0) * 1000)
+        await asyncio.sleep(0.01)
+
+
+async def login(client: httpx.AsyncClient, until: float, statuses: Counter):
+    while time.perf_counter() < until:
+        try:
+            r = await client.post("/token", data={"username": EMAIL, "password": PASSWORD})
+            statuses[r.status_code] += 1
+            if r.status_code == 503:
+                # como um cliente bem-comportado: espera o Retry-After antes de tentar de novo
+                await asyncio.sleep(float(r.headers.get("Retry-After", 1)))
+        except httpx.TimeoutException:
+            statuses["timeout"] += 1
+
+
+def report(label: str, latencies: list[float]):
+    print(
+        f"{label:<22}{len(latencies):>8}{statistics.median(latencies):>10.1f}"
+        f"{percentile(latencies, 0.95):>10.1f}{percentile(latencies, 0.99):>10.1f}{max(latencies):>10.1f}"
+    )
+
+
+async def main(url: str, logins: int, probes: int, seconds: float):
+    limits = httpx.Limits(max_connections=logins + probes + 10)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=TIMEOUT) as client:
+        customer_id = await setup(client)
+
+        idle: list[float] = []
+        until = time.perf_counter() + min(seconds, 5)
+        await asyncio.gather(*(probe(client, customer_id, until, idle) for _ in range(probes)))
+
+        storm: list[float] = []
+        statuses: Counter = Counter()
+        until = time.perf_counter() + seconds
+        await asyncio.gather(
+            *(login(client, until, statuses) for _ in range(logins)),
+            *(probe(client, customer_id, until, storm) for _ in range(probes)),
+        )
+
+    print(f"GET /customers/{{id}} ({probes} clientes), latência em ms")
+    print(f"{'':<22}{'n':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    report("sem logins", idle)
+    report(f"{logins} logins em paralelo", storm)
+    ok = statuses.get(200, 0)
+    print(f"POST /token: {dict(statuses)} ({ok / seconds:.1f} logins/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--logins", type=int, default=200, help="clientes fazendo login sem parar")
+    parser.add_argument("--probes", type=int, default=4, help="clientes medindo o CRUD")
+    parser.add_argument("--seconds", type=float, default=15)
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.logins, args.probes, args.seconds))